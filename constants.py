@@ -11,6 +11,11 @@ HANDLE_SIZE = 10  # Velikost táhla pro změnu velikosti v px (ignoruje zoom)
 MIN_NODE_W  = 80  # Minimální šířka uzlu při změně velikosti
 MIN_NODE_H  = 50  # Minimální výška uzlu při změně velikosti
 
+# === Vykreslování ===
+FULL_UPDATE_ITEM_COUNT = 500  # Od tohoto počtu prvků ve scéně view překresluje celý viewport
+AA_MIN_ZOOM = 0.5  # Pod tímto zoomem se geometrie kreslí bez antialiasingu
+PIXMAP_CACHE_KB = 32 * 1024  # Limit QPixmapCache (cache vykreslených uzlů) v KB
+
 # === Typy vazeb (linků) v OPM ===
 LINK_TYPES = [
     # Procedurální vazby (vztahy mezi procesy a objekty)
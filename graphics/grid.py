@@ -6,16 +6,94 @@ Mřížka je „hairline“ (šířka pera = 0), takže má vždy 1 px bez ohled
 
 from __future__ import annotations
 import math
+from contextlib import contextmanager
 from PySide6.QtCore import QRectF, QPointF, Qt
 from PySide6.QtGui import QPainter, QPen
-from PySide6.QtWidgets import QGraphicsScene
-from constants import GRID_SIZE
+from PySide6.QtWidgets import QGraphicsScene, QGraphicsItem, QGraphicsView
+from constants import GRID_SIZE, FULL_UPDATE_ITEM_COUNT
 
 class GridScene(QGraphicsScene):
     def __init__(self, parent=None):
         """Inicializuje GridScene s mřížkou zapnutou."""
         super().__init__(parent)
         self._draw_grid = True  # Flag pro zapínání/vypínání mřížky
+        # Scéna se změnila od poslední synchronizace do globálního modelu
+        self._dirty = True
+        # Cache pro itemsBoundingRect() (zneplatní se při každé změně scény)
+        self._cached_bounds = None
+        # Průběžný počet prvků vložených přes addItem (bez potomků) - bez alokace items()
+        self._item_count = 0
+        self._large = False  # True nad FULL_UPDATE_ITEM_COUNT prvků
+        self.changed.connect(self._on_changed)
+    
+    def _on_changed(self, *_args) -> None:
+        """Označí scénu jako změněnou a zneplatní cache odvozené z jejího obsahu."""
+        self._dirty = True
+        self._cached_bounds = None
+    
+    def addItem(self, item: QGraphicsItem) -> None:
+        """Vloží prvek do scény a započítá ho do počtu prvků."""
+        if item.scene() is not self:
+            self._item_count += 1
+        super().addItem(item)
+        self._update_size_class()
+    
+    def removeItem(self, item: QGraphicsItem) -> None:
+        """Odebere prvek ze scény a odečte ho z počtu prvků."""
+        if item.scene() is self and self._item_count > 0:
+            self._item_count -= 1
+        super().removeItem(item)
+        self._update_size_class()
+    
+    def clear(self) -> None:
+        """Odstraní všechny prvky scény a vynuluje jejich počet."""
+        super().clear()
+        self._item_count = 0
+        self._update_size_class()
+    
+    def _update_size_class(self) -> None:
+        """Při překročení prahu FULL_UPDATE_ITEM_COUNT přepne režim překreslování pohledů."""
+        large = self._item_count > FULL_UPDATE_ITEM_COUNT
+        if large == self._large:
+            return
+        self._large = large
+        for view in self.views():
+            self.apply_viewport_update_mode(view)
+    
+    def apply_viewport_update_mode(self, view: QGraphicsView) -> None:
+        """Nastaví pohledu režim překreslování podle velikosti scény.
+        
+        U velkých scén je levnější překreslit celý viewport než sjednocovat
+        obdélníky jednotlivých změněných prvků.
+        """
+        if self._large:
+            view.setViewportUpdateMode(QGraphicsView.FullViewportUpdate)
+        else:
+            view.setViewportUpdateMode(QGraphicsView.BoundingRectViewportUpdate)
+    
+    def cached_items_bounding_rect(self) -> QRectF:
+        """Vrátí itemsBoundingRect(), dokud se scéna nezmění z cache."""
+        if self._cached_bounds is None:
+            self._cached_bounds = self.itemsBoundingRect()
+        return QRectF(self._cached_bounds)
+    
+    @contextmanager
+    def uncached_rendering(self):
+        """Po dobu bloku vykresluje prvky bez cache (pro export přes render()).
+        
+        render() jinak použije pixmapy z DeviceCoordinateCache uzlů - SVG by obsahovalo
+        rastry místo vektorů a rastrové exporty kopie pixmap z obrazovky.
+        """
+        cached = [(it, it.cacheMode()) for it in self.items()
+                  if it.cacheMode() != QGraphicsItem.NoCache]
+        for it, _mode in cached:
+            it.setCacheMode(QGraphicsItem.NoCache)
+        try:
+            yield
+        finally:
+            for it, mode in cached:
+                if it.scene() is self:
+                    it.setCacheMode(mode)
     
     def set_draw_grid(self, enabled: bool) -> None:
         """Nastaví, zda se má kreslit mřížka."""
@@ -37,6 +37,9 @@ class BaseNodeItem:
             QGraphicsItem.ItemSendsGeometryChanges
         )
         self.setAcceptHoverEvents(True)
+        # Uzly se kreslí do cache pixmapy, při posunu/scrollu se jen překopíruje;
+        # překreslí se až po update() (změna labelu, tokenu, výběru, velikosti)
+        self.setCacheMode(QGraphicsItem.DeviceCoordinateCache)
 
     def itemChange(self, change, value):
         res = super().itemChange(change, value)
@@ -179,6 +182,10 @@ class ObjectItem(ResizableMixin, BaseNodeItem, QGraphicsRectItem):
     def itemChange(self, change, value):
         res = super().itemChange(change, value)
 
+        if change in (QGraphicsItem.ItemChildAddedChange, QGraphicsItem.ItemChildRemovedChange):
+            # Umístění názvu závisí na stavech → zneplatni cache vykreslení
+            self.update()
+
         if change == QGraphicsItem.ItemPositionHasChanged:
             # update linků objektu (už řeší BaseNodeItem)
             # navíc update linků jeho stavů
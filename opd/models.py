@@ -1,9 +1,15 @@
 """Datové modely pro reprezentaci OPD (Object-Process Diagram) prvků."""
-from dataclasses import dataclass
-from typing import Optional
+from dataclasses import dataclass, fields
+from typing import Any, Dict, Optional
 
 
-@dataclass
+def _known_fields(cls, d: Dict[str, Any]) -> Dict[str, Any]:
+    """Vrátí jen ty položky slovníku, které odpovídají polím dataclassy."""
+    names = {f.name for f in fields(cls)}
+    return {k: v for k, v in d.items() if k in names}
+
+
+@dataclass(slots=True)
 class DiagramNode:
     """
     Reprezentuje jeden uzel v diagramu (objekt, proces nebo stav).
@@ -34,8 +40,16 @@ class DiagramNode:
     affiliation: str = "systemic"
     state_kind: Optional[str] = None
 
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "DiagramNode":
+        """Vytvoří uzel ze slovníku (např. z JSON), neznámé klíče ignoruje."""
+        data = _known_fields(cls, d)
+        # Starší soubory bez klíče "essence" se načítaly jako informatické
+        data.setdefault("essence", "informatical")
+        return cls(**data)
 
-@dataclass
+
+@dataclass(slots=True)
 class DiagramLink:
     """
     Reprezentuje vazbu (link) mezi dvěma uzly v diagramu.
@@ -63,4 +77,12 @@ class DiagramLink:
     label_dx: float = 6.0
     label_dy: float = 12.0
     card_src: str = ""  # Kardinalita u zdroje
-    card_dst: str = ""  # Kardinalita u cíle
\ No newline at end of file
+    card_dst: str = ""  # Kardinalita u cíle
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "DiagramLink":
+        """Vytvoří vazbu ze slovníku (např. z JSON), neznámé klíče ignoruje."""
+        data = _known_fields(cls, d)
+        data.setdefault("id", "")
+        data.setdefault("link_type", "consumption")
+        return cls(**data)
\ No newline at end of file
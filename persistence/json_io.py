@@ -7,7 +7,7 @@ import json
 import os
 import re
 from dataclasses import asdict
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple, Union
 
 from PySide6.QtCore import QPointF, QRectF
 from PySide6.QtWidgets import QFileDialog, QMessageBox, QGraphicsItem
@@ -37,15 +37,15 @@ def safe_base_filename(title: str | None = None) -> str:
     return base or "Canvas"
     
 
-def scene_to_dict(scene) -> Dict[str, Any]:
+def scene_to_models(scene) -> Tuple[List[DiagramNode], List[DiagramLink]]:
     """
-    Převede scénu s diagramem na slovník (pro JSON export).
+    Převede scénu s diagramem na seznamy datových modelů.
     
     Args:
         scene: QGraphicsScene obsahující diagram
     
     Returns:
-        Slovník s klíči "nodes", "links" a "meta"
+        Dvojice (uzly, vazby)
     """
     nodes: List[DiagramNode] = []  # Seznam uzlů pro export
     links: List[DiagramLink] = []  # Seznam vazeb pro export
@@ -100,6 +100,20 @@ def scene_to_dict(scene) -> Dict[str, Any]:
                 card_dst=it.card_dst if hasattr(it, "card_dst") else "",
             ))
             
+    return nodes, links
+
+
+def scene_to_dict(scene) -> Dict[str, Any]:
+    """
+    Převede scénu s diagramem na slovník (pro JSON export).
+    
+    Args:
+        scene: QGraphicsScene obsahující diagram
+    
+    Returns:
+        Slovník s klíči "nodes", "links" a "meta"
+    """
+    nodes, links = scene_to_models(scene)
     return {
         "nodes": [asdict(n) for n in nodes],
         "links": [asdict(l) for l in links],
@@ -107,73 +121,155 @@ def scene_to_dict(scene) -> Dict[str, Any]:
     }
     
 
+def _as_node(n: Union[DiagramNode, Dict[str, Any]]) -> DiagramNode:
+    """Vrátí uzel jako DiagramNode (slovník z JSON převede)."""
+    return n if isinstance(n, DiagramNode) else DiagramNode.from_dict(n)
+
+
+def _as_link(l: Union[DiagramLink, Dict[str, Any]]) -> DiagramLink:
+    """Vrátí vazbu jako DiagramLink (slovník z JSON převede)."""
+    return l if isinstance(l, DiagramLink) else DiagramLink.from_dict(l)
+
+
+def _scene_item_pool(scene) -> Dict[str, QGraphicsItem]:
+    """Vrátí mapování node_id → uzel, který už ve scéně existuje (pro znovupoužití)."""
+    return {
+        it.node_id: it for it in scene.items()
+        if isinstance(it, (ObjectItem, ProcessItem, StateItem))
+    }
+
+
+def _drop_pooled_item(scene, it: QGraphicsItem) -> None:
+    """Odebere ze scény uzel, který se při načítání znovu nepoužil."""
+    parent = it.parentItem()
+    states = getattr(parent, "_states", None) if parent is not None else None
+    if states is not None and it in states:
+        states.remove(it)
+    # Stav mohl zmizet už spolu se svým rodičem
+    if it.scene() is scene:
+        scene.removeItem(it)
+
+
 def dict_to_scene(scene, data: Dict[str, Any], allowed_link) -> None:
     """
     Načte slovník (z JSON) do scény.
     
+    Uzly, které už ve scéně existují (stejné ID a typ), se znovu použijí a jen
+    se jim aktualizuje pozice, velikost a vlastnosti. Nové uzly se vytvoří,
+    přebývající se odeberou. Vazby se vždy vytvoří znovu.
+    
     Args:
         scene: Cílová QGraphicsScene
-        data: Slovník s klíči "nodes" a "links"
+        data: Slovník s klíči "nodes" a "links"; položky mohou být slovníky (z JSON)
+            nebo DiagramNode/DiagramLink (linky mohou být libovolný iterovatelný
+            objekt, prochází se jen jednou)
         allowed_link: Callback funkce pro validaci vazeb
     """
-    scene.clear()  # Vyčistí scénu před načtením
+    pool = _scene_item_pool(scene)  # Mapování ID → existující uzel
     id_to_item: Dict[str, QGraphicsItem] = {}  # Mapování ID → item pro propojení vazeb
     
-    for n in data.get("nodes", []):
-        kind = n["kind"]
-        pos = QPointF(n["x"], n["y"])
+    # Vazby závisí na koncových uzlech, proto je vždy vytvoříme znovu
+    for it in scene.items():
+        if isinstance(it, LinkItem):
+            it.remove_refs()
+            scene.removeItem(it)
+    
+    nodes = [_as_node(n) for n in data.get("nodes", [])]
+    
+    for n in nodes:
+        kind = n.kind
+        pos = QPointF(n.x, n.y)
         if kind == "object":
-            it = ObjectItem(
-                QRectF(-n["w"]/2, -n["h"]/2, n["w"], n["h"]), 
-                n["label"],
-                essence=n.get("essence", "informatical"),
-                affiliation=n.get("affiliation", "systemic")
-            )
-            it.node_id = n["id"]
-            it.parent_process_id = n.get("parent_process_id")
+            rect = QRectF(-n.w/2, -n.h/2, n.w, n.h)
+            it = pool.pop(n.id, None)
+            if isinstance(it, ObjectItem):
+                it.setRect(rect)
+                it.set_label(n.label)
+                it.essence = n.essence
+                it.affiliation = n.affiliation
+                # essence/affiliation jsou prosté atributy - zneplatníme cache vykreslení
+                it.update()
+            else:
+                if it is not None:
+                    _drop_pooled_item(scene, it)
+                it = ObjectItem(
+                    rect, 
+                    n.label,
+                    essence=n.essence,
+                    affiliation=n.affiliation
+                )
+                it.node_id = n.id
+                scene.addItem(it)
+            it.parent_process_id = n.parent_process_id
             it.setPos(pos)
-            scene.addItem(it)
-            id_to_item[n["id"]] = it
+            id_to_item[n.id] = it
             
-    for n in data.get("nodes", []):
-        if n["kind"] == "process":
-            it = ProcessItem(
-                QRectF(-n["w"]/2, -n["h"]/2, n["w"], n["h"]), 
-                n["label"],
-                essence=n.get("essence", "informatical"),
-                affiliation=n.get("affiliation", "systemic")
-            )
-            it.node_id = n["id"]
-            it.parent_process_id = n.get("parent_process_id")
-            it.setPos(QPointF(n["x"], n["y"]))
-            scene.addItem(it); id_to_item[n["id"]] = it
+    for n in nodes:
+        if n.kind == "process":
+            rect = QRectF(-n.w/2, -n.h/2, n.w, n.h)
+            it = pool.pop(n.id, None)
+            if isinstance(it, ProcessItem):
+                it.setRect(rect)
+                it.set_label(n.label)
+                it.essence = n.essence
+                it.affiliation = n.affiliation
+                # essence/affiliation jsou prosté atributy - zneplatníme cache vykreslení
+                it.update()
+            else:
+                if it is not None:
+                    _drop_pooled_item(scene, it)
+                it = ProcessItem(
+                    rect, 
+                    n.label,
+                    essence=n.essence,
+                    affiliation=n.affiliation
+                )
+                it.node_id = n.id
+                scene.addItem(it)
+            it.parent_process_id = n.parent_process_id
+            it.setPos(QPointF(n.x, n.y))
+            id_to_item[n.id] = it
             
-    for n in data.get("nodes", []):
-        if n["kind"] == "state" and n.get("parent_id") in id_to_item:
-            parent = id_to_item[n["parent_id"]]
-            local_center = parent.mapFromScene(QPointF(n["x"], n["y"]))
-            rect = QRectF(local_center.x()-n["w"]/2, local_center.y()-n["h"]/2, n["w"], n["h"])
-            it = StateItem(parent, rect, n["label"], n.get("state_kind", "standard"))
-            it.node_id = n["id"]
-            scene.addItem(it)
-            id_to_item[n["id"]] = it
+    for n in nodes:
+        if n.kind == "state" and n.parent_id in id_to_item:
+            parent = id_to_item[n.parent_id]
+            local_center = parent.mapFromScene(QPointF(n.x, n.y))
+            rect = QRectF(local_center.x()-n.w/2, local_center.y()-n.h/2, n.w, n.h)
+            it = pool.pop(n.id, None)
+            if isinstance(it, StateItem) and it.parentItem() is parent:
+                it.setRect(rect)
+                it.set_label(n.label)
+                it.set_state_kind(n.state_kind or "standard")
+            else:
+                if it is not None:
+                    _drop_pooled_item(scene, it)
+                it = StateItem(parent, rect, n.label, n.state_kind or "standard")
+                it.node_id = n.id
+                # Stav je potomkem rodiče, který už ve scéně je
+                if it.scene() is not scene:
+                    scene.addItem(it)
+            id_to_item[n.id] = it
+
+    # Uzly, které v datech už nejsou
+    for it in pool.values():
+        _drop_pooled_item(scene, it)
 
     invalid = 0
-    for l in data.get("links", []):
-        src = id_to_item.get(l["src"])
-        dst = id_to_item.get(l["dst"])
+    for l in map(_as_link, data.get("links", [])):
+        src = id_to_item.get(l.src)
+        dst = id_to_item.get(l.dst)
         if src and dst:
-            lt = l.get("link_type", "consumption")
+            lt = l.link_type
             ok, msg = allowed_link(src, dst, lt)
             if not ok:
                 invalid += 1
                 continue
-            li = LinkItem(src, dst, lt, l.get("label", ""))
+            li = LinkItem(src, dst, lt, l.label)
             scene.addItem(li)    
-            li._type_offset  = QPointF(l.get("type_dx", 6.0),  l.get("type_dy", -6.0))
-            li._label_offset = QPointF(l.get("label_dx", 6.0), l.get("label_dy", 12.0))
-            li.set_card_src(l.get("card_src", ""))
-            li.set_card_dst(l.get("card_dst", ""))
+            li._type_offset  = QPointF(l.type_dx, l.type_dy)
+            li._label_offset = QPointF(l.label_dx, l.label_dy)
+            li.set_card_src(l.card_src)
+            li.set_card_dst(l.card_dst)
             li.update_path()
             
     if invalid:
@@ -215,8 +311,8 @@ def save_scene_as_json(scene, title: str | None = None, main_window=None):
         
         # Uložme celý globální datový model
         data_to_save = {
-            "nodes": main_window._global_diagram_data.get("nodes", []),
-            "links": main_window._global_diagram_data.get("links", []),
+            "nodes": [asdict(n) for n in main_window._global_diagram_data.get("nodes", [])],
+            "links": [asdict(l) for l in main_window._global_diagram_data.get("links", [])],
             "meta": {
                 **main_window._global_diagram_data.get("meta", {}),
                 "format": "opm-mvp-json-hierarchy",
@@ -275,7 +371,9 @@ def load_scene_from_json(scene, allowed_link, new_canvas_callback=None, new_tab:
             view = new_canvas_callback(base)
             target_scene = view.scene()
 
-        # Načtení dat do scény
+        # Načtení dat do scény - import nahrazuje celý obsah, znovupoužití prvků
+        # by nic neušetřilo a ve scéně by zůstaly i prvky, které nejsou uzly ani vazby
+        target_scene.clear()
         dict_to_scene(target_scene, data, allowed_link)
 
 
@@ -290,16 +388,16 @@ def _load_hierarchy_from_json(main_window, data: Dict[str, Any], allowed_link):
     """
     # Nejdřív vymažeme všechny existující taby (kromě root)
     # nebo vytvoříme nový root canvas
-    nodes = data.get("nodes", [])
-    links = data.get("links", [])
+    nodes = [DiagramNode.from_dict(n) for n in data.get("nodes", [])]
+    links = [DiagramLink.from_dict(l) for l in data.get("links", [])]
     
     # Vytvoříme procesní mapu (process_id -> process_data)
-    process_map = {n["id"]: n for n in nodes if n.get("kind") == "process"}
+    process_map = {n.id: n for n in nodes if n.kind == "process"}
     
     # Najdeme procesy, které mají podprocesy/objekty (ty potřebují in-zoom canvas)
     processes_with_children = set()
     for node in nodes:
-        parent_id = node.get("parent_process_id")
+        parent_id = node.parent_process_id
         if parent_id and parent_id in process_map:
             processes_with_children.add(parent_id)
     
@@ -328,16 +426,16 @@ def _load_hierarchy_from_json(main_window, data: Dict[str, Any], allowed_link):
     
     # Načteme root prvky (parent_process_id == None)
     root_data = {
-        "nodes": [n for n in nodes if n.get("parent_process_id") is None],
+        "nodes": [n for n in nodes if n.parent_process_id is None],
         "links": [],  # Linky se načtou podle uzlů
         "meta": data.get("meta", {})
     }
     
     # Načteme linky, které spojují root uzly
-    root_node_ids = {n["id"] for n in root_data["nodes"]}
+    root_node_ids = {n.id for n in root_data["nodes"]}
     root_data["links"] = [
         l for l in links
-        if l.get("src") in root_node_ids and l.get("dst") in root_node_ids
+        if l.src in root_node_ids and l.dst in root_node_ids
     ]
     
     dict_to_scene(root_scene, root_data, allowed_link)
@@ -351,16 +449,16 @@ def _load_hierarchy_from_json(main_window, data: Dict[str, Any], allowed_link):
         # Najdi procesy, které patří do tohoto parent_process_id
         child_processes = [
             p for p in process_map.values()
-            if p.get("parent_process_id") == parent_process_id
+            if p.parent_process_id == parent_process_id
         ]
         
         for process in child_processes:
-            process_id = process["id"]
+            process_id = process.id
             
             # Pokud má tento proces děti, vytvoř pro něj in-zoom canvas
             if process_id in processes_with_children:
                 # Vytvoř in-zoom canvas
-                tab_title = f"🔍 {process.get('label', 'Process')}"
+                tab_title = f"🔍 {process.label or 'Process'}"
                 zoom_view = main_window._new_canvas(
                     title=tab_title,
                     parent_view=parent_view,
@@ -370,16 +468,16 @@ def _load_hierarchy_from_json(main_window, data: Dict[str, Any], allowed_link):
                 
                 # Načti prvky pro tento proces
                 process_data = {
-                    "nodes": [n for n in nodes if n.get("parent_process_id") == process_id],
+                    "nodes": [n for n in nodes if n.parent_process_id == process_id],
                     "links": [],
                     "meta": data.get("meta", {})
                 }
                 
                 # Načti linky pro tento proces
-                process_node_ids = {n["id"] for n in process_data["nodes"]}
+                process_node_ids = {n.id for n in process_data["nodes"]}
                 process_data["links"] = [
                     l for l in links
-                    if l.get("src") in process_node_ids and l.get("dst") in process_node_ids
+                    if l.src in process_node_ids and l.dst in process_node_ids
                 ]
                 
                 dict_to_scene(zoom_scene, process_data, allowed_link)
@@ -6,8 +6,11 @@ C/E (Condition/Event) Petriho síť je jednoduchý typ Petriho sítě, kde:
 - Tokeny reprezentují objekty ve stavech
 """
 from __future__ import annotations
-from typing import Dict, Set, List, Optional, Tuple
+from typing import Dict, Set, List, NamedTuple, Optional, Tuple
 from dataclasses import dataclass
+import logging
+
+log = logging.getLogger(__name__)
 
 
 @dataclass
@@ -50,6 +53,14 @@ class Arc:
         return hash((self.place_id, self.transition_id, self.arc_type))
 
 
+class TransitionStates(NamedTuple):
+    """Rozdělení přechodů podle stavu (seznamy ID v pořadí přechodů v síti)."""
+    enabled: List[str]  # Aktivní (vstupy splněny)
+    fireable: List[str]  # Mohou proběhnout (aktivní + volné výstupy)
+    blocked: List[str]  # Aktivní, ale výstupy jsou obsazené (procesní zádrhely)
+    waiting: List[str]  # Čekají na vstupy
+
+
 class PetriNet:
     """C/E Petriho síť pro simulaci OPM diagramu."""
     
@@ -77,6 +88,10 @@ class PetriNet:
         if place_id in self.places:
             self.marking[place_id] = has_token
             
+    def clear_marking(self):
+        """Odebere tokeny ze všech míst najednou."""
+        self.marking = dict.fromkeys(self.places, False)
+        
     def has_token(self, place_id: str) -> bool:
         """Zkontroluje, zda má místo token."""
         return self.marking.get(place_id, False)
@@ -152,7 +167,10 @@ class PetriNet:
         """
         if not self.is_enabled(transition_id):
             return False
-            
+        return self._outputs_free(transition_id)
+    
+    def _outputs_free(self, transition_id: str) -> bool:
+        """Zkontroluje výstupy aktivního přechodu (část can_fire bez is_enabled)."""
         # Pro C/E sítě: výstupní místa musí být volná (nemají token)
         output_places = self.get_output_places(transition_id)
         # Pokud přechod nemá výstupní místa, nemůže proběhnout (pro C/E sítě)
@@ -172,7 +190,7 @@ class PetriNet:
         
         # Pokud jsou vstupní a výstupní místa ze stejného objektu, povolíme provedení
         if input_place_objects & output_place_objects:
-            print(f"[PetriNet.can_fire] Input-output link pair detected for same object, allowing fire")
+            log.debug("can_fire: input-output link pair detected for same object, allowing fire")
             return True
         
         return False
@@ -195,10 +213,8 @@ class PetriNet:
             if pl and pl.state_label is not None:
                 by_obj.setdefault(pl.object_id, []).append(pid)
         if any(len(pids) > 1 for pids in by_obj.values()):
-            print(
-                "[PetriNet.fire_transition] Ambiguous state outputs for same object; "
-                "use SimulationEngine.step()."
-            )
+            log.warning("fire_transition: ambiguous state outputs for same object; "
+                        "use SimulationEngine.step().")
             return False
         if not self.activate_transition(transition_id):
             return False
@@ -232,19 +248,18 @@ class PetriNet:
                 continue
             by_object.setdefault(pl.object_id, []).append(arc.place_id)
 
-        print(f"[PetriNet.activate_transition] Removing tokens for {len(by_object)} object(s) with input arcs:")
+        log.debug("activate_transition: removing tokens for %d object(s) with input arcs", len(by_object))
         for object_id in sorted(by_object.keys()):
             sat_union: Set[str] = set()
             for pid in by_object[object_id]:
                 sat_union |= self._sat_set_for_place(pid)
             holders = [pid for pid in sat_union if self.has_token(pid)]
             if not holders:
-                print(f"[PetriNet.activate_transition] ERROR: no token for object {object_id}")
+                log.error("activate_transition: no token for object %s", object_id)
                 return False
             pid = holders[0]
             place = self.places.get(pid)
-            place_label = place.label if place else pid
-            print(f"  - {place_label} (place_id={pid})")
+            log.debug("  - %s (place_id=%s)", place.label if place else pid, pid)
             self.set_token(pid, False)
                 
         return True
@@ -261,14 +276,15 @@ class PetriNet:
         # Zkontrolujeme, zda má přechod výstupní místa
         output_places = self.get_output_places(transition_id)
         if not output_places:
-            print(f"[PetriNet.complete_transition] Transition {transition_id} has no output places")
+            log.debug("complete_transition: transition %s has no output places", transition_id)
             return False
         
         # Zkontrolujeme, zda jsou výstupní místa volná
         # Pro input-output link pairs: po aktivaci (odebrání tokenu ze vstupu) by měla být volná
         blocked_outputs = [pid for pid in output_places if self.has_token(pid)]
         if blocked_outputs:
-            print(f"[PetriNet.complete_transition] Transition {transition_id} blocked: output places {blocked_outputs} have tokens")
+            log.debug("complete_transition: transition %s blocked, output places %s have tokens",
+                      transition_id, blocked_outputs)
             # Pro input-output link pairs: zkontrolujeme, zda jsou to různá místa stejného objektu
             # Pokud ano, měli bychom povolit dokončení (token byl odebrán ze vstupu při aktivaci)
             input_places = self.get_input_test_places(transition_id)
@@ -277,17 +293,16 @@ class PetriNet:
             
             # Pokud jsou vstupní a výstupní místa ze stejného objektu, povolíme dokončení
             if input_place_objects & output_place_objects:
-                print(f"[PetriNet.complete_transition] Input-output link pair detected for same object, allowing completion")
+                log.debug("complete_transition: input-output link pair detected for same object, allowing completion")
             else:
                 return False
             
         # Přidáme tokeny do výstupních míst
         output_arcs = [arc for arc in self.arcs if arc.transition_id == transition_id and arc.arc_type == "output"]
-        print(f"[PetriNet.complete_transition] Adding tokens to {len(output_arcs)} output places:")
+        log.debug("complete_transition: adding tokens to %d output places", len(output_arcs))
         for arc in output_arcs:
             place = self.places.get(arc.place_id)
-            place_label = place.label if place else arc.place_id
-            print(f"  - {place_label} (place_id={arc.place_id})")
+            log.debug("  - %s (place_id=%s)", place.label if place else arc.place_id, arc.place_id)
             self.set_token(arc.place_id, True)
                 
         return True
@@ -337,24 +352,40 @@ class PetriNet:
         fireable = set(self.get_fireable_transitions())
         blocked = list(enabled - fireable)
         
-        print(f"[PetriNet.get_blocked_transitions] Enabled: {enabled}")
-        print(f"[PetriNet.get_blocked_transitions] Fireable: {fireable}")
-        print(f"[PetriNet.get_blocked_transitions] Blocked: {blocked}")
-        
-        if blocked:
+        # Diagnostika je drahá (další průchody oblouky), počítá se jen při zapnutém debug logu
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("get_blocked_transitions: enabled=%s fireable=%s blocked=%s",
+                      enabled, fireable, blocked)
             for tid in blocked:
                 transition = self.transitions.get(tid)
                 output_places = self.get_output_places(tid)
-                output_tokens = [self.has_token(pid) for pid in output_places]
                 input_places = self.get_input_places(tid)
-                input_tokens = [self.has_token(pid) for pid in input_places]
-                print(f"[PetriNet] Blocked transition {transition.label if transition else tid}:")
-                print(f"  Input places: {input_places} with tokens: {input_tokens}")
-                print(f"  Output places: {output_places} with tokens: {output_tokens}")
-                print(f"  is_enabled: {self.is_enabled(tid)}")
-                print(f"  can_fire: {self.can_fire(tid)}")
+                log.debug("Blocked transition %s: inputs %s with tokens %s, outputs %s with tokens %s",
+                          transition.label if transition else tid,
+                          input_places, [self.has_token(pid) for pid in input_places],
+                          output_places, [self.has_token(pid) for pid in output_places])
         return blocked
     
+    def get_transition_states(self) -> TransitionStates:
+        """Rozdělí všechny přechody na aktivní/proveditelné/blokované/čekající jedním průchodem.
+        
+        Každý přechod se vyhodnotí nejvýš jednou pomocí is_enabled a _outputs_free,
+        místo čtyř samostatných průchodů get_*_transitions.
+        """
+        states = TransitionStates([], [], [], [])
+        input_tids = {arc.transition_id for arc in self.arcs if arc.arc_type in ("input", "test")}
+        for tid in self.transitions:
+            if self.is_enabled(tid):
+                states.enabled.append(tid)
+                if self._outputs_free(tid):
+                    states.fireable.append(tid)
+                else:
+                    states.blocked.append(tid)
+            elif tid in input_tids:
+                # Jen přechody s alespoň jedním vstupem (jinak jsou nevalidní)
+                states.waiting.append(tid)
+        return states
+    
     def get_waiting_transitions(self) -> List[str]:
         """Vrátí seznam ID přechodů, které čekají na vstupy (nejsou aktivní)."""
         all_transitions = set(self.transitions.keys())
@@ -1,11 +1,14 @@
 """Simulační engine pro OPM diagramy."""
 from __future__ import annotations
-from typing import Dict, List, Optional, Callable
+from typing import Dict, FrozenSet, List, Optional, Callable
+import logging
 from PySide6.QtCore import QTimer, QObject, Signal
 from PySide6.QtWidgets import QApplication
-from simulation.petri_net import PetriNet
+from simulation.petri_net import PetriNet, TransitionStates
 from simulation.converter import build_petri_net_from_scene
 
+log = logging.getLogger(__name__)
+
 
 class SimulationEngine(QObject):
     """Engine pro simulaci Petriho sítě."""
@@ -23,7 +26,7 @@ class SimulationEngine(QObject):
         self.timer.timeout.connect(self._step)
         self.simulation_speed = 1000  # ms mezi kroky
         
-        # Mapování place_id -> grafické prvky pro vizualizaci
+        # Mapování place_id -> grafické prvky pro vizualizaci (jen ObjectItem/StateItem s has_token)
         self.place_to_items: Dict[str, List] = {}
         
     def build_net(self):
@@ -48,21 +51,17 @@ class SimulationEngine(QObject):
 
             if getattr(place, "is_hidden", False):
                 self.place_to_items[place_id] = []
-                print(f"[Simulator] Hidden place (no graphics): {place_id}")
+                log.debug("Hidden place (no graphics): %s", place_id)
                 continue
 
             if getattr(place, "is_aggregate", False):
                 for item in self.scene.items():
                     if isinstance(item, ObjectItem) and item.node_id == place.object_id:
                         items.append(item)
-                        print(
-                            f"[Simulator] Mapped aggregate place {place_id} to ObjectItem '{item.label}'"
-                        )
+                        log.debug("Mapped aggregate place %s to ObjectItem '%s'", place_id, item.label)
                         break
                 if not items:
-                    print(
-                        f"[Simulator] WARNING: ObjectItem for aggregate place {place_id} not found"
-                    )
+                    log.warning("ObjectItem for aggregate place %s not found", place_id)
                 self.place_to_items[place_id] = items
                 continue
             
@@ -75,14 +74,16 @@ class SimulationEngine(QObject):
                         for child in item.childItems():
                             if isinstance(child, StateItem) and child.label == place.state_label:
                                 items.append(child)
-                                print(f"[Simulator] Mapped place {place_id} to StateItem '{child.label}' of object '{item.label}'")
+                                log.debug("Mapped place %s to StateItem '%s' of object '%s'",
+                                          place_id, child.label, item.label)
                                 break
                         else:
-                            print(f"[Simulator] WARNING: StateItem '{place.state_label}' not found for object '{item.label}' (place {place_id})")
+                            log.warning("StateItem '%s' not found for object '%s' (place %s)",
+                                        place.state_label, item.label, place_id)
                     else:
                         # Objekt bez stavu
                         items.append(item)
-                        print(f"[Simulator] Mapped place {place_id} to ObjectItem '{item.label}'")
+                        log.debug("Mapped place %s to ObjectItem '%s'", place_id, item.label)
             
             # Pokud jsme nenašli žádné itemy, zkusme najít StateItem přímo
             # (pro případ, že StateItem je top-level item, což by nemělo být, ale pro jistotu)
@@ -93,11 +94,12 @@ class SimulationEngine(QObject):
                         if parent and isinstance(parent, ObjectItem) and parent.node_id == place.object_id:
                             if item.label == place.state_label:
                                 items.append(item)
-                                print(f"[Simulator] Mapped place {place_id} to StateItem '{item.label}' (found directly)")
+                                log.debug("Mapped place %s to StateItem '%s' (found directly)", place_id, item.label)
                                 break
                         
             if not items and not getattr(place, "is_hidden", False):
-                print(f"[Simulator] WARNING: No items found for place {place_id} (object_id={place.object_id}, state_label={place.state_label})")
+                log.warning("No items found for place %s (object_id=%s, state_label=%s)",
+                            place_id, place.object_id, place.state_label)
                         
             self.place_to_items[place_id] = items
             
@@ -113,8 +115,7 @@ class SimulationEngine(QObject):
         # Pro C/E sítě: můžeme nastavit počáteční tokeny
         # Pro OPM: inicializujeme podle prvního stavu objektu nebo explicitně
         # Zatím: žádné tokeny (prázdné označení)
-        for place_id in self.net.places.keys():
-            self.net.set_token(place_id, False)
+        self.net.clear_marking()
             
     def set_initial_tokens(self, place_ids: List[str]):
         """Nastaví počáteční tokeny na zadaných místech."""
@@ -145,18 +146,18 @@ class SimulationEngine(QObject):
         Najde první přechod, který může proběhnout, a provede ho najednou.
         """
         if not self.net:
-            print("[Simulator] No net built")
+            log.debug("No net built")
             return False
         
         # Najdeme všechny přechody, které mohou proběhnout
         fireable = self.net.get_fireable_transitions()
         if not fireable:
-            print(f"[Simulator] No fireable transitions")
+            log.debug("No fireable transitions")
             return False  # Žádný přechod nemůže proběhnout
             
         # Vybereme první přechod, který může proběhnout (lze změnit na náhodný výběr)
         transition_id = fireable[0]
-        print(f"[Simulator] Firing transition: {transition_id}")
+        log.debug("Firing transition: %s", transition_id)
 
         # 1) Najdeme výstupní místa, která patří objektům se "složenými" cílovými stavy.
         output_places = self.net.get_output_places(transition_id)
@@ -244,7 +245,7 @@ class SimulationEngine(QObject):
 
                 from PySide6.QtWidgets import QDialog
                 if dlg.exec() != QDialog.Accepted:
-                    print(f"[Simulator] Selection cancelled for object {object_id}")
+                    log.debug("Selection cancelled for object %s", object_id)
                     return False
 
                 selected_from_dialog = dlg.get_selected_place_ids()
@@ -252,15 +253,15 @@ class SimulationEngine(QObject):
 
         # 3) Teď teprve provedeme fázi 1 (odebrání tokenů z inputů)
         if not self.net.activate_transition(transition_id):
-            print(f"[Simulator] Failed to activate transition: {transition_id}")
+            log.warning("Failed to activate transition: %s", transition_id)
             return False
 
         # 4) A dokončíme fázi 2: přidáme tokeny jen do vybraných output míst
         if not self.net.complete_transition_selected(transition_id, list(selected_place_ids)):
-            print(f"[Simulator] Failed to complete transition with selected outputs: {transition_id}")
+            log.warning("Failed to complete transition with selected outputs: %s", transition_id)
             return False
 
-        print(f"[Simulator] Transition fired successfully")
+        log.debug("Transition fired successfully")
         self.transition_fired.emit(transition_id)
         self.marking_changed.emit()
         return True
@@ -276,8 +277,7 @@ class SimulationEngine(QObject):
         self.stop()
         if self.net:
             # Resetujeme na prázdné označení
-            for place_id in self.net.places.keys():
-                self.net.set_token(place_id, False)
+            self.net.clear_marking()
             self.marking_changed.emit()
             
     def get_marking(self) -> Dict[str, bool]:
@@ -286,6 +286,18 @@ class SimulationEngine(QObject):
             return {}
         return {pid: self.net.has_token(pid) for pid in self.net.places.keys()}
         
+    def get_marked_places(self) -> FrozenSet[str]:
+        """Vrátí neměnnou množinu míst s tokenem (přesné porovnání označení)."""
+        if not self.net:
+            return frozenset()
+        return frozenset(pid for pid, has_token in self.net.marking.items() if has_token)
+        
+    def get_transition_states(self) -> TransitionStates:
+        """Vrátí aktivní, proveditelné, blokované a čekající přechody najednou."""
+        if not self.net:
+            return TransitionStates([], [], [], [])
+        return self.net.get_transition_states()
+        
     def get_enabled_transitions(self) -> List[str]:
         """Vrátí seznam ID aktivních přechodů."""
         if not self.net:
@@ -79,10 +79,10 @@ class ProcessHierarchyPanel(QDockWidget):
             
             # Získej všechny procesy
             nodes = self.main_window._global_diagram_data.get("nodes", [])
-            processes = [n for n in nodes if n.get("kind") == "process"]
+            processes = [n for n in nodes if n.kind == "process"]
             
             # Najdi root procesy (bez parent_process_id)
-            root_processes = [p for p in processes if not p.get("parent_process_id")]
+            root_processes = [p for p in processes if not p.parent_process_id]
             
             # Vytvoř kořenovou položku pro root canvas
             root_item = QTreeWidgetItem(self.tree)
@@ -100,7 +100,7 @@ class ProcessHierarchyPanel(QDockWidget):
             }
             
             # Vytvoř slovník procesů podle ID
-            process_dict = {p["id"]: p for p in processes}
+            process_dict = {p.id: p for p in processes}
             
             # Přidej root procesy pod root item
             for process in root_processes:
@@ -121,12 +121,12 @@ class ProcessHierarchyPanel(QDockWidget):
     
     def _add_process_to_tree(self, process, parent_item, process_dict, all_processes):
         """Rekurzivně přidá proces a jeho podprocesy do stromu."""
-        process_id = process["id"]
-        process_label = process.get("label", "Process")
-        parent_process_id = process.get("parent_process_id")
+        process_id = process.id
+        process_label = process.label or "Process"
+        parent_process_id = process.parent_process_id
         
         # Najdi podprocesy
-        children = [p for p in all_processes if p.get("parent_process_id") == process_id]
+        children = [p for p in all_processes if p.parent_process_id == process_id]
         child_count = len(children)
         
         # Vytvoř text s ikonou
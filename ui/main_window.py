@@ -1,12 +1,14 @@
 """Hlavní okno aplikace OPM Editor."""
 from __future__ import annotations
 from typing import Optional
+import logging
 
-from PySide6.QtCore import Qt, QRectF, QPointF
+from PySide6.QtCore import Qt, QRectF, QPointF, QObject, QTimer, QThreadPool
 from PySide6.QtGui import (
     QAction,
     QImage,
     QPainter,
+    QPixmapCache,
     QUndoStack,
     QKeySequence,
 )
@@ -14,6 +16,7 @@ from PySide6.QtWidgets import (
     QApplication,
     QFileDialog,
     QGraphicsItem,
+    QGraphicsScene,
     QInputDialog,
     QMainWindow,
     QMessageBox,
@@ -34,12 +37,23 @@ from ui.dialogs import show_opl_import_dialog, show_nl_to_opl_dialog, show_opl_p
 from persistence.json_io import safe_base_filename
 from undo.commands import DeleteItemsCommand, ClearAllCommand, AddStateCommand, AddNodeCommand, PasteItemsCommand
 
+log = logging.getLogger(__name__)
+
 
 class MainWindow(QMainWindow):
     """Hlavní okno aplikace OPM Editor."""
     
     _instance = None
     
+    # Klávesy pro mazání a rychlé přepínání typu linku (sestavené jednou, ne při každém stisku)
+    _DELETE_KEYS = frozenset({Qt.Key_Delete, Qt.Key_Backspace})
+    _LINK_KEY_MAP = {
+        Qt.Key_1: "consumption/result",
+        Qt.Key_2: "effect",
+        Qt.Key_3: "agent",
+        Qt.Key_4: "instrument",
+    }
+    
     @classmethod
     def instance(cls):
         """Vrátí instanci MainWindow (singleton pattern)."""
@@ -50,6 +64,10 @@ class MainWindow(QMainWindow):
         MainWindow._instance = self
         self.setWindowTitle("OPM Editor — MVP")
         
+        # Uzly se kreslí přes DeviceCoordinateCache, jejíž pixmapy drží QPixmapCache;
+        # výchozích 10 MB nestačí na větší diagram při vyšším zoomu
+        QPixmapCache.setCacheLimit(PIXMAP_CACHE_KB)
+        
         # Inicializace stavových proměnných
         self.mode = Mode.SELECT
         self._scale = 1.0
@@ -57,6 +75,10 @@ class MainWindow(QMainWindow):
         self.default_link_type = "consumption/result"  # Výchozí typ vazby
         self._suppress_combo = False
         
+        # Mřížka pro snap() (lokální kopie konstanty + převrácená hodnota pro násobení)
+        self._grid_size = GRID_SIZE
+        self._inv_grid = 1.0 / GRID_SIZE
+        
         # Undo stack
         self.undo_stack = QUndoStack(self)
         
@@ -65,8 +87,8 @@ class MainWindow(QMainWindow):
         
         # Globální datový model pro všechny canvasy
         self._global_diagram_data = {
-            "nodes": [],  # Seznam všech uzlů (včetně podprocesů)
-            "links": [],  # Seznam všech vazeb
+            "nodes": [],  # Seznam všech uzlů - DiagramNode (včetně podprocesů)
+            "links": [],  # Seznam všech vazeb - DiagramLink
             "meta": {"format": "opm-mvp-json", "version": 1}
         }
         
@@ -77,6 +99,17 @@ class MainWindow(QMainWindow):
         self._is_syncing = False
         self._is_refreshing_hierarchy = False
         self._is_navigating = False
+        self._hierarchy_refresh_pending = False  # Obnovení hierarchie je naplánované
+        self._props_refresh_pending = False  # Obnovení properties panelu je naplánované
+        
+        # Znovupoužitelné buffery pro export obrázků: (šířka, výška, formát) → QImage
+        self._export_img_cache: dict[tuple[int, int, QImage.Format], QImage] = {}
+        
+        # Handly připojení selectionChanged aktuální scény (pro odpojení při přepnutí tabu)
+        self._selection_connections = []
+        
+        # Vybrané linky aktuální scény (udržováno ze selectionChanged, čte se v keyPressEvent)
+        self._selected_links: set[LinkItem] = set()
         
         # Inicializace UI
         self._init_tabs()
@@ -94,9 +127,27 @@ class MainWindow(QMainWindow):
         self.setCentralWidget(self.tabs)
         self.tabs.currentChanged.connect(self._on_tab_changed)
         
+        # In-zoom view podle procesu (přepočítává se při přidání/odebrání tabu).
+        # Mapy drží view, ne indexy - index se zjistí až při hledání přes indexOf(),
+        # takže přesun tabu (tabMoved přijde dřív, než QTabWidget přeskládá stránky) mapy nerozbije.
+        self._tabs_by_zoom_id = {}  # (parent_view, process_id) → in-zoom view
+        self._view_by_zoom_id = {}  # process_id → in-zoom view
+        
         bar = RenameableTabBar(self.tabs)
         self.tabs.setTabBar(bar)
         bar.renameRequested.connect(self._rename_tab)
+        bar.tabsChanged.connect(self._rebuild_tab_maps)
+    
+    def _rebuild_tab_maps(self):
+        """Přepočítá mapování in-zoom procesů na jejich view."""
+        self._tabs_by_zoom_id = {}
+        self._view_by_zoom_id = {}
+        for i in range(self.tabs.count()):
+            view = self.tabs.widget(i)
+            zoom_id = getattr(view, 'zoomed_process_id', None)
+            if zoom_id is not None:
+                self._tabs_by_zoom_id.setdefault((getattr(view, 'parent_view', None), zoom_id), view)
+                self._view_by_zoom_id.setdefault(zoom_id, view)
     
     def _init_first_canvas(self):
         """Vytvoří první canvas."""
@@ -138,9 +189,12 @@ class MainWindow(QMainWindow):
         self.dock_props = PropertiesPanel(self)
         self.addDockWidget(Qt.RightDockWidgetArea, self.dock_props)
         
-        # Připojí změnu výběru na panel
-        print("[Init] Connecting properties panel to scene.selectionChanged")
-        self.scene.selectionChanged.connect(self.update_properties_panel)
+        # Skrytý panel se neaktualizuje, po znovuzobrazení se proto dorovná
+        self.dock_props.visibilityChanged.connect(
+            lambda visible: visible and self._on_selection_changed()
+        )
+        
+        # selectionChanged je už připojený v _activate_view, stačí panel naplnit
         self.update_properties_panel()
     
     def _init_hierarchy_panel(self):
@@ -148,7 +202,7 @@ class MainWindow(QMainWindow):
         from ui.hierarchy_panel import ProcessHierarchyPanel
         self.dock_hierarchy = ProcessHierarchyPanel(self)
         self.addDockWidget(Qt.LeftDockWidgetArea, self.dock_hierarchy)
-        self.dock_hierarchy.refresh_tree()
+        self.refresh_hierarchy_panel()
     
     def _init_simulation_panel(self):
         """Inicializuje simulační panel."""
@@ -161,14 +215,29 @@ class MainWindow(QMainWindow):
     
     def push_cmd(self, cmd):
         """Přidá příkaz na undo stack."""
+        self.scene._dirty = True
         self.undo_stack.push(cmd)
     
     def snap(self, p: QPointF) -> QPointF:
         """Přichytí bod na mřížku."""
-        return QPointF(
-            round(p.x() / GRID_SIZE) * GRID_SIZE,
-            round(p.y() / GRID_SIZE) * GRID_SIZE
-        )
+        g = self._grid_size
+        inv = self._inv_grid
+        return QPointF(round(p.x() * inv) * g, round(p.y() * inv) * g)
+    
+    def _export_buffer(self, rb: QRectF, fmt: QImage.Format, fill) -> QImage:
+        """Vrátí vyplněný QImage pro export dané oblasti, pokud možno z předchozího exportu.
+        
+        Drží se nejvýše dva buffery (nejdéle nepoužitý se zahodí).
+        """
+        key = (int(rb.width()), int(rb.height()), fmt)
+        img = self._export_img_cache.pop(key, None)
+        if img is None:
+            if len(self._export_img_cache) >= 2:
+                del self._export_img_cache[next(iter(self._export_img_cache))]
+            img = QImage(key[0], key[1], fmt)
+        self._export_img_cache[key] = img
+        img.fill(fill)
+        return img
     
     def selected_item(self) -> Optional[QGraphicsItem]:
         """Vrátí první vybraný prvek nebo None."""
@@ -324,40 +393,35 @@ class MainWindow(QMainWindow):
             if scene is None:
                 scene = self.scene
             
-            from persistence.json_io import scene_to_dict
-            from opd.models import DiagramNode, DiagramLink
+            from persistence.json_io import scene_to_models
             
-            # Převeď scénu na slovník
-            scene_data = scene_to_dict(scene)
+            # Převeď scénu na datové modely
+            scene_nodes, scene_links = scene_to_models(scene)
             
             # Nastav parent_process_id pro uzly v této scéně
-            for node in scene_data["nodes"]:
-                if node.get("kind") in ("object", "process"):
-                    node["parent_process_id"] = parent_process_id
+            for node in scene_nodes:
+                if node.kind in ("object", "process"):
+                    node.parent_process_id = parent_process_id
             
-            # Odstraň staré uzly a linky z této scény
-            self._global_diagram_data["nodes"] = [
-                n for n in self._global_diagram_data["nodes"]
-                if n.get("parent_process_id") != parent_process_id
-            ]
+            # Odstraň staré uzly a linky z této scény (na místě, bez nového seznamu)
+            nodes = self._global_diagram_data["nodes"]
+            nodes[:] = [n for n in nodes if n.parent_process_id != parent_process_id]
             
             # Přidej nové uzly a linky
-            self._global_diagram_data["nodes"].extend(scene_data["nodes"])
+            nodes.extend(scene_nodes)
             
             # Pro linky odstraníme ty, které souvisí s uzly z této scény
-            scene_node_ids = {n["id"] for n in scene_data["nodes"]}
-            self._global_diagram_data["links"] = [
-                l for l in self._global_diagram_data.get("links", [])
-                if l.get("src") not in scene_node_ids and l.get("dst") not in scene_node_ids
-            ]
-            self._global_diagram_data["links"].extend(scene_data["links"])
+            scene_node_ids = {n.id for n in scene_nodes}
+            links = self._global_diagram_data.setdefault("links", [])
+            links[:] = [l for l in links
+                        if l.src not in scene_node_ids and l.dst not in scene_node_ids]
+            links.extend(scene_links)
+            scene._dirty = False
             
             # Refresh hierarchického panelu
             self.refresh_hierarchy_panel()
-        except Exception as e:
-            print(f"Error in sync_scene_to_global_model: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            log.exception("sync_scene_to_global_model failed")
         finally:
             self._is_syncing = False
     
@@ -370,28 +434,26 @@ class MainWindow(QMainWindow):
             parent_process_id: ID procesu, jehož podprocesy chceme načíst
         """
         try:
-            print(f"[Sync] Loading data into scene for parent_process_id={parent_process_id}")
+            log.debug("Sync: loading data into scene for parent_process_id=%s", parent_process_id)
             
             from persistence.json_io import dict_to_scene
             
-            # Vyfiltruj uzly a linky pro tuto scénu
-            filtered_nodes = [
-                n for n in self._global_diagram_data["nodes"]
-                if n.get("parent_process_id") == parent_process_id
-            ]
-            
-            print(f"[Sync] Found {len(filtered_nodes)} nodes")
+            # Vyfiltruj uzly pro tuto scénu a zároveň sestav množinu jejich ID
+            # (dict_to_scene prochází uzly vícekrát, proto seznam)
+            filtered_nodes = []
+            node_ids = set()
+            for n in self._global_diagram_data["nodes"]:
+                if n.parent_process_id == parent_process_id:
+                    filtered_nodes.append(n)
+                    node_ids.add(n.id)
             
-            # Vytvoř množinu ID uzlů v této scéně
-            node_ids = {n["id"] for n in filtered_nodes}
+            log.debug("Sync: found %d nodes", len(filtered_nodes))
             
-            # Vyfiltruj linky, které spojují uzly v této scéně
-            filtered_links = [
+            # Linky, které spojují uzly v této scéně - dict_to_scene je projde jen jednou
+            filtered_links = (
                 l for l in self._global_diagram_data.get("links", [])
-                if l.get("src") in node_ids and l.get("dst") in node_ids
-            ]
-            
-            print(f"[Sync] Found {len(filtered_links)} links")
+                if l.src in node_ids and l.dst in node_ids
+            )
             
             # Načti data do scény
             filtered_data = {
@@ -401,15 +463,25 @@ class MainWindow(QMainWindow):
             }
             
             dict_to_scene(scene, filtered_data, self.allowed_link)
-            print(f"[Sync] Scene loaded successfully")
+            log.debug("Sync: scene loaded")
             
-        except Exception as e:
-            print(f"[ERROR] sync_global_model_to_scene failed: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            log.exception("sync_global_model_to_scene failed")
     
     def refresh_hierarchy_panel(self):
+        """Naplánuje obnovení hierarchického panelu.
+        
+        Více volání v jednom průchodu event loopu vede jen k jednomu obnovení stromu.
+        """
+        if self._hierarchy_refresh_pending:
+            return
+        self._hierarchy_refresh_pending = True
+        QTimer.singleShot(0, self._do_hierarchy_refresh)
+    
+    def _do_hierarchy_refresh(self):
         """Obnoví hierarchický panel."""
+        self._hierarchy_refresh_pending = False
+        
         # Ochrana proti rekurzivním voláním
         if self._is_refreshing_hierarchy:
             return
@@ -418,10 +490,8 @@ class MainWindow(QMainWindow):
         try:
             if hasattr(self, 'dock_hierarchy'):
                 self.dock_hierarchy.refresh_tree()
-        except Exception as e:
-            print(f"Error in refresh_hierarchy_panel: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            log.exception("refresh_hierarchy_panel failed")
         finally:
             self._is_refreshing_hierarchy = False
     
@@ -433,11 +503,11 @@ class MainWindow(QMainWindow):
             process_id: ID procesu
             parent_process_id: ID rodičovského procesu (None pro root)
         """
-        print(f"[Navigate] Request to navigate to process_id={process_id}, parent={parent_process_id}")
+        log.debug("Navigate: process_id=%s, parent=%s", process_id, parent_process_id)
         
         # Ochrana proti rekurzivním voláním
         if self._is_navigating:
-            print("[Navigate] Already navigating, skipping...")
+            log.debug("Navigate: already navigating, skipping")
             return
         
         self._is_navigating = True
@@ -445,15 +515,15 @@ class MainWindow(QMainWindow):
             # Najdi proces v datovém modelu
             process_node = None
             for n in self._global_diagram_data["nodes"]:
-                if n["id"] == process_id and n["kind"] == "process":
+                if n.id == process_id and n.kind == "process":
                     process_node = n
                     break
             
             if not process_node:
-                print(f"[Navigate] Process not found: {process_id}")
+                log.warning("Navigate: process not found: %s", process_id)
                 return
             
-            print(f"[Navigate] Found process: {process_node['label']}")
+            log.debug("Navigate: found process %s", process_node.label)
             
             # Najdi scénu, ve které je proces
             parent_view = self._find_view_for_parent_process_id(parent_process_id)
@@ -462,24 +532,24 @@ class MainWindow(QMainWindow):
                 parent_view = self._find_root_view()
             
             if not parent_view:
-                print("[Navigate] Parent view not found!")
+                log.warning("Navigate: parent view not found")
                 return
             
-            print(f"[Navigate] Found parent view")
+            log.debug("Navigate: found parent view")
             
             # Hledej existující in-zoom tab
             existing_tab_idx = self._find_in_zoom_tab_for_process(process_id, parent_view)
             if existing_tab_idx >= 0:
-                print(f"[Navigate] Switching to existing tab {existing_tab_idx}")
+                log.debug("Navigate: switching to existing tab %d", existing_tab_idx)
                 self.tabs.setCurrentIndex(existing_tab_idx)
                 # Aktualizuj properties panel
                 self.update_properties_panel()
                 return
             
-            print(f"[Navigate] Creating new in-zoom tab")
+            log.debug("Navigate: creating new in-zoom tab")
             
             # Vytvoř nový in-zoom tab
-            tab_title = f"🔍 {process_node['label']}"
+            tab_title = f"🔍 {process_node.label}"
             
             # Vytvoř nový view
             new_view = self._new_canvas(
@@ -489,7 +559,7 @@ class MainWindow(QMainWindow):
             )
             
             if not new_view:
-                print("[Navigate] Failed to create new view!")
+                log.error("Navigate: failed to create new view")
                 return
             
             # Načti data do nové scény
@@ -498,13 +568,11 @@ class MainWindow(QMainWindow):
             # Aktualizuj properties panel pro nový view
             self.update_properties_panel()
             
-            self.statusBar().showMessage(f"In-zoom: {process_node['label']}", 2000)
-            print(f"[Navigate] Navigation completed successfully")
+            self.statusBar().showMessage(f"In-zoom: {process_node.label}", 2000)
+            log.debug("Navigate: completed")
             
-        except Exception as e:
-            print(f"[ERROR] navigate_into_process_by_id failed: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            log.exception("navigate_into_process_by_id failed")
         finally:
             self._is_navigating = False
     
@@ -513,11 +581,7 @@ class MainWindow(QMainWindow):
         if parent_process_id is None:
             return self._find_root_view()
         
-        for i in range(self.tabs.count()):
-            view = self.tabs.widget(i)
-            if hasattr(view, 'zoomed_process_id') and view.zoomed_process_id == parent_process_id:
-                return view
-        return None
+        return self._view_by_zoom_id.get(parent_process_id)
     
     def _find_root_view(self):
         """Najde root view (view bez parent_view)."""
@@ -549,8 +613,8 @@ class MainWindow(QMainWindow):
         """
         # Aktualizuj v globálním modelu
         for node in self._global_diagram_data["nodes"]:
-            if node["id"] == process_id and node["kind"] == "process":
-                node["label"] = new_label
+            if node.id == process_id and node.kind == "process":
+                node.label = new_label
                 break
         
         # Najdi a aktualizuj proces ve všech otevřených view
@@ -579,6 +643,9 @@ class MainWindow(QMainWindow):
         """Vytvoří nový canvas v novém tabu."""
         scene = GridScene(self)
         scene.setSceneRect(-5000, -5000, 10000, 10000)
+        # BSP index s automatickou hloubkou (podle počtu prvků)
+        scene.setItemIndexMethod(QGraphicsScene.BspTreeIndex)
+        scene.setBspTreeDepth(0)
 
         view = EditorView(scene, self, parent_view=parent_view, zoomed_process_id=zoomed_process_id)
         
@@ -601,8 +668,11 @@ class MainWindow(QMainWindow):
         """
         current_view = self.view
         
-        # Nejprve synchronizuj aktuální scénu do globálního modelu
-        self.sync_scene_to_global_model(self.scene, getattr(current_view, 'zoomed_process_id', None))
+        # Nejprve synchronizuj aktuální scénu do globálního modelu (jen pokud se změnila).
+        # Synchronizace shodí příznak _dirty, takže _activate_view při přepnutí
+        # na nový/existující tab stejnou scénu znovu neserializuje.
+        if getattr(self.scene, '_dirty', True):
+            self.sync_scene_to_global_model(self.scene, getattr(current_view, 'zoomed_process_id', None))
         
         # Nejprve zkontroluj, zda už existuje in-zoom tab pro tento proces
         existing_tab_idx = self._find_in_zoom_tab_for_process(process_item.node_id, current_view)
@@ -639,14 +709,8 @@ class MainWindow(QMainWindow):
         Returns:
             Index tabu nebo -1, pokud nebyl nalezen
         """
-        for i in range(self.tabs.count()):
-            view = self.tabs.widget(i)
-            if (hasattr(view, 'zoomed_process_id') and 
-                view.zoomed_process_id == process_id and
-                hasattr(view, 'parent_view') and
-                view.parent_view == parent_view):
-                return i
-        return -1
+        view = self._tabs_by_zoom_id.get((parent_view, process_id))
+        return self.tabs.indexOf(view) if view is not None else -1
     
     def navigate_to_parent(self):
         """Naviguje zpět na parent view (out-zoom)."""
@@ -665,67 +729,73 @@ class MainWindow(QMainWindow):
             self.act_out_zoom.setVisible(has_parent)
     
     def _find_tab_index_for_view(self, view):
-        """Najde index tabu pro daný view."""
-        for i in range(self.tabs.count()):
-            if self.tabs.widget(i) == view:
-                return i
-        return -1
+        """Najde index tabu pro daný view (-1, pokud view v tabech není)."""
+        return self.tabs.indexOf(view) if view is not None else -1
 
     def _activate_view(self, view):
         """Aktivuje daný view a připojí signály."""
         try:
-            print(f"[Activate] Activating view with zoomed_process_id={getattr(view, 'zoomed_process_id', None)}")
+            log.debug("Activate: view with zoomed_process_id=%s", getattr(view, 'zoomed_process_id', None))
             
             # Synchronizuj starý view do globálního modelu před přepnutím
-            # ale jen pokud není již synchronizace v běhu
-            if hasattr(self, 'view') and hasattr(self, 'scene') and not self._is_syncing:
+            # ale jen pokud není již synchronizace v běhu a scéna se od poslední synchronizace změnila
+            if (hasattr(self, 'view') and hasattr(self, 'scene') and not self._is_syncing
+                    and getattr(self.scene, '_dirty', True)):
                 old_parent_process_id = getattr(self.view, 'zoomed_process_id', None)
-                print(f"[Activate] Syncing old view with parent_process_id={old_parent_process_id}")
+                log.debug("Activate: syncing old view with parent_process_id=%s", old_parent_process_id)
                 self.sync_scene_to_global_model(self.scene, old_parent_process_id)
             
-            # Odpojí staré signály
-            try:
-                if hasattr(self, 'scene'):
-                    print(f"[Activate] Disconnecting old signals")
-                    self.scene.selectionChanged.disconnect(self.sync_selected_to_props)
-                    self.scene.selectionChanged.disconnect(self.update_properties_panel)
-            except Exception as e:
-                print(f"[Activate] Could not disconnect old signals: {e}")
-                pass
+            # Odpojí staré signály přes uložené handly (bez výjimek při prvním přepnutí)
+            for conn in self._selection_connections:
+                QObject.disconnect(conn)
+            self._selection_connections = []
             
             # Zkontroluj, že view a scene existují
             if not view:
-                print("[ERROR] View is None!")
+                log.error("Activate: view is None")
                 return
             
             scene = view.scene()
             if not scene:
-                print("[ERROR] Scene is None!")
+                log.error("Activate: scene is None")
                 return
             
-            self.view = view
-            self.scene = scene
-            
-            print(f"[Activate] Connecting selectionChanged signals")
-            # Připoj signály
-            self.scene.selectionChanged.connect(self.sync_selected_to_props)
-            self.scene.selectionChanged.connect(self.update_properties_panel)
+            # Překreslení proběhne jednou až po dokončení přepnutí
+            view.setUpdatesEnabled(False)
+            try:
+                self.view = view
+                self.scene = scene
+                
+                # Režim překreslování podle průběžného počtu prvků scény
+                # (při vkládání/mazání ho scéna dál přepíná sama)
+                if isinstance(scene, GridScene):
+                    scene.apply_viewport_update_mode(view)
+                self._update_antialiasing(view, view.transform().m11())
+                
+                log.debug("Activate: connecting selectionChanged signals")
+                # Připoj signály
+                self._selection_connections = [
+                    self.scene.selectionChanged.connect(self._on_selection_changed_cache_links),
+                    self.scene.selectionChanged.connect(self._on_selection_changed),
+                ]
 
-            # Vyčistí overlaye/stav linku
-            self.view.clear_overlays()
-            self.pending_link_src = None
-            
-            # Aktualizuj viditelnost out-zoom tlačítka
-            self.update_out_zoom_button_visibility()
-            
-            # Aktualizuj properties panel
-            self.update_properties_panel()
+                self._on_selection_changed_cache_links()
+
+                # Vyčistí overlaye/stav linku
+                self.view.clear_overlays()
+                self.pending_link_src = None
+                
+                # Aktualizuj viditelnost out-zoom tlačítka
+                self.update_out_zoom_button_visibility()
+                
+                # Aktualizuj properties panel
+                self.update_properties_panel()
+            finally:
+                view.setUpdatesEnabled(True)
             
-            print(f"[Activate] View activated successfully")
-        except Exception as e:
-            print(f"[ERROR] _activate_view failed: {e}")
-            import traceback
-            traceback.print_exc()
+            log.debug("Activate: view activated")
+        except Exception:
+            log.exception("_activate_view failed")
 
     def _current_tab_title(self) -> str:
         """Vrátí text aktivní záložky nebo fallback."""
@@ -790,35 +860,40 @@ class MainWindow(QMainWindow):
         """Nastaví režim editoru."""
         self.mode = mode
         
-        # Zrušit výběr všech prvků při přepnutí nástroje
-        self.scene.clearSelection()
-        
+        # Změny kurzoru, drag módu a overlayů se překreslí najednou
+        self.view.setUpdatesEnabled(False)
         try:
-            if hasattr(self, 'actions') and mode in self.actions:
-                self.actions[mode].setChecked(True)
-        except Exception:
-            pass
-        
-        if mode == Mode.SELECT:
-            self.view.setCursor(Qt.ArrowCursor)
-            self.view.setDragMode(EditorView.RubberBandDrag)
-            self.view.clear_overlays()
-        else:
-            self.view.setCursor(Qt.CrossCursor)
-            self.view.setDragMode(EditorView.NoDrag)
-        
-        self.statusBar().showMessage(f"Mode: {mode}")
-        
-        if mode != Mode.ADD_LINK:
-            self.pending_link_src = None
-            self.view.clear_temp_link()
-        
-        # Vynutit okamžitou aktualizaci ghost overlay pro nový mód
-        if mode in (Mode.ADD_OBJECT, Mode.ADD_PROCESS, Mode.ADD_STATE):
-            # Získat aktuální pozici kurzoru
-            cursor_pos = self.view.mapFromGlobal(self.view.cursor().pos())
-            scene_pos = self.view.mapToScene(cursor_pos)
-            self.view.update_ghost(scene_pos)
+            # Zrušit výběr všech prvků při přepnutí nástroje
+            self.scene.clearSelection()
+            
+            try:
+                if hasattr(self, 'actions') and mode in self.actions:
+                    self.actions[mode].setChecked(True)
+            except Exception:
+                pass
+            
+            if mode == Mode.SELECT:
+                self.view.setCursor(Qt.ArrowCursor)
+                self.view.setDragMode(EditorView.RubberBandDrag)
+                self.view.clear_overlays()
+            else:
+                self.view.setCursor(Qt.CrossCursor)
+                self.view.setDragMode(EditorView.NoDrag)
+            
+            self.statusBar().showMessage(f"Mode: {mode}")
+            
+            if mode != Mode.ADD_LINK:
+                self.pending_link_src = None
+                self.view.clear_temp_link()
+            
+            # Vynutit okamžitou aktualizaci ghost overlay pro nový mód
+            if mode in (Mode.ADD_OBJECT, Mode.ADD_PROCESS, Mode.ADD_STATE):
+                # Získat aktuální pozici kurzoru
+                cursor_pos = self.view.mapFromGlobal(self.view.cursor().pos())
+                scene_pos = self.view.mapToScene(cursor_pos)
+                self.view.update_ghost(scene_pos)
+        finally:
+            self.view.setUpdatesEnabled(True)
 
     def set_zoom(self, scale: float):
         """Nastaví konkrétní úroveň zoomu."""
@@ -835,10 +910,18 @@ class MainWindow(QMainWindow):
         self._scale = scale
         self.view.resetTransform()
         self.view.scale(scale, scale)
+        self._update_antialiasing(self.view, scale)
         
         # Aktualizuj UI
         self._update_zoom_ui()
     
+    @staticmethod
+    def _update_antialiasing(view, scale: float):
+        """Zapne antialiasing geometrie jen při zoomu, kde je rozdíl vidět."""
+        enabled = scale >= AA_MIN_ZOOM
+        if bool(view.renderHints() & QPainter.Antialiasing) != enabled:
+            view.setRenderHint(QPainter.Antialiasing, enabled)
+    
     def _update_zoom_ui(self):
         """Aktualizuje UI prvky pro zoom (slider a label)."""
         if hasattr(self, 'zoom_slider') and hasattr(self, 'zoom_value_label'):
@@ -1033,8 +1116,13 @@ class MainWindow(QMainWindow):
     
     def handle_link_click(self, pos: QPointF):
         """Zpracuje kliknutí v režimu přidávání linku."""
-        item = self.scene.itemAt(pos, self.view.transform())
-        if not isinstance(item, (ObjectItem, ProcessItem, StateItem)):
+        # Nejvyšší uzel pod kurzorem (dotaz jde přes BSP index scény)
+        item = next((
+            it for it in self.scene.items(pos, Qt.IntersectsItemShape, Qt.DescendingOrder,
+                                          self.view.transform())
+            if isinstance(it, (ObjectItem, ProcessItem, StateItem))
+        ), None)
+        if item is None:
             return
         
         if self.pending_link_src is None:
@@ -1065,9 +1153,7 @@ class MainWindow(QMainWindow):
         if hasattr(self, "view") and hasattr(self.view, "clear_temp_link"):
             self.view.clear_temp_link()
         
-        sb = getattr(self, "statusBar", None)
-        if callable(sb):
-            self.statusBar().clearMessage()
+        self.statusBar().clearMessage()
     
     # ========== Delete operations ==========
     
@@ -1088,19 +1174,34 @@ class MainWindow(QMainWindow):
     
     def update_properties_panel(self):
         """Aktualizuje properties panel."""
-        print("[MainWindow] update_properties_panel called")
+        log.debug("update_properties_panel called")
         if hasattr(self, 'dock_props'):
-            self.dock_props.update_for_selection()
+            if self.dock_props.isVisible():
+                self.dock_props.update_for_selection()
         else:
-            print("[MainWindow] No dock_props!")
+            log.warning("update_properties_panel: no dock_props")
     
-    def sync_selected_to_props(self):
-        """Synchronizuje výběr do properties panelu."""
-        print("[MainWindow] sync_selected_to_props called")
-        if hasattr(self, 'dock_props'):
-            self.dock_props.sync_selection_to_props()
-        else:
-            print("[MainWindow] No dock_props in sync_selected_to_props!")
+    def _on_selection_changed(self):
+        """Naplánuje obnovení properties panelu po změně výběru.
+        
+        Při výběru gumou nebo Ctrl+A přijde selectionChanged pro každý prvek,
+        panel se ale obnoví jen jednou za průchod event loopu.
+        """
+        if self._props_refresh_pending:
+            return
+        self._props_refresh_pending = True
+        QTimer.singleShot(0, self._flush_props)
+    
+    def _flush_props(self):
+        """Obnoví properties panel podle aktuálního výběru."""
+        self._props_refresh_pending = False
+        if not hasattr(self, 'dock_props') or not self.dock_props.isVisible():
+            return
+        self.dock_props.update_for_selection(self.scene.selectedItems())
+    
+    def _on_selection_changed_cache_links(self):
+        """Přepočítá množinu vybraných linků aktuální scény."""
+        self._selected_links = {it for it in self.scene.selectedItems() if isinstance(it, LinkItem)}
     
     # ========== Dialogy ==========
     
@@ -1128,11 +1229,15 @@ class MainWindow(QMainWindow):
             )
             if not path:
                 return
-            rb = self.scene.itemsBoundingRect().adjusted(-20, -20, 20, 20)
-            img = QImage(int(rb.width()), int(rb.height()), QImage.Format_RGB32)
-            img.fill(Qt.white)
+            rb = self.scene.cached_items_bounding_rect().adjusted(-20, -20, 20, 20)
+            # JPG nemá alfa kanál → stačí 3 bajty na pixel
+            img = self._export_buffer(rb, QImage.Format_RGB888, Qt.white)
             painter = QPainter(img)
-            self.scene.render(painter, target=QRectF(0, 0, rb.width(), rb.height()), source=rb)
+            # Antialiasing jen pro text, geometrie se kreslí bez AA
+            painter.setRenderHint(QPainter.Antialiasing, False)
+            painter.setRenderHint(QPainter.TextAntialiasing, True)
+            with self.scene.uncached_rendering():
+                self.scene.render(painter, target=QRectF(0, 0, rb.width(), rb.height()), source=rb)
             painter.end()
             img.save(path, "JPG", 95)
 
@@ -1146,11 +1251,12 @@ class MainWindow(QMainWindow):
             original_grid_state = self.scene._draw_grid
             self.scene.set_draw_grid(False)
             try:
-                rb = self.scene.itemsBoundingRect().adjusted(-20, -20, 20, 20)
-                img = QImage(int(rb.width()), int(rb.height()), QImage.Format_ARGB32_Premultiplied)
-                img.fill(0x00FFFFFF)
+                rb = self.scene.cached_items_bounding_rect().adjusted(-20, -20, 20, 20)
+                img = self._export_buffer(rb, QImage.Format_ARGB32_Premultiplied, 0x00FFFFFF)
                 painter = QPainter(img)
-                self.scene.render(painter, target=QRectF(0, 0, rb.width(), rb.height()), source=rb)
+                painter.setRenderHint(QPainter.SmoothPixmapTransform, False)
+                with self.scene.uncached_rendering():
+                    self.scene.render(painter, target=QRectF(0, 0, rb.width(), rb.height()), source=rb)
                 painter.end()
                 img.save(path)
             finally:
@@ -1163,30 +1269,62 @@ class MainWindow(QMainWindow):
             )
             if not path:
                 return
-            rb = self.scene.itemsBoundingRect().adjusted(-20, -20, 20, 20)
+            rb = self.scene.cached_items_bounding_rect().adjusted(-20, -20, 20, 20)
             gen = QSvgGenerator()
             gen.setFileName(path)
             gen.setSize(rb.size().toSize())
             gen.setViewBox(rb)
             painter = QPainter(gen)
-            self.scene.render(painter, target=rb, source=rb)
+            # SVG se kreslí přímo do generátoru, aby obsahoval vektory, ne rastry
+            with self.scene.uncached_rendering():
+                self.scene.render(painter, target=rb, source=rb)
             painter.end()
 
         else:
             QMessageBox.warning(self, "Export", f"Unsupported format: {kind}")
     
+    def closeEvent(self, event):
+        """Před zavřením okna počká na dokončení ukládání GIFu na pozadí."""
+        if hasattr(self, 'dock_simulation') and self.dock_simulation.is_saving_gif():
+            self.statusBar().showMessage("Finishing GIF export...")
+            # Úloha emituje signály panelu - panel nesmí zaniknout dřív, než doběhne
+            QThreadPool.globalInstance().waitForDone()
+        super().closeEvent(event)
+    
     # ========== Keyboard events ==========
     
     def keyPressEvent(self, event):
         """Zpracuje stisknutí klávesy."""
+        k = event.key()
+        
+        # Rychlé přepínání typu linku čísly
+        lt = self._LINK_KEY_MAP.get(k)
+        if lt is not None:
+            if self._selected_links:
+                for ln in self._selected_links:
+                    # Pokud je to consumption/result, převedeme na konkrétní typ podle zdroje a cíle
+                    resolved_type = self._resolve_link_type(ln.src, ln.dst, lt)
+                    ln.set_link_type(resolved_type)
+                self.update_properties_panel()
+            else:
+                # Když není nic vybráno, nastaví se default pro další link
+                # Combo jen zobrazuje hodnotu - bez hledání textu a bez signálů
+                self.default_link_type = lt
+                self.cmb_default_link_type.blockSignals(True)
+                self.cmb_default_link_type.setCurrentIndex(self._link_type_to_index[lt])
+                self.cmb_default_link_type.blockSignals(False)
+            
+            event.accept()
+            return
+        
         # Mazání
-        if event.key() in (Qt.Key_Delete, Qt.Key_Backspace):
+        if k in self._DELETE_KEYS:
             self.delete_selected()
             event.accept()
             return
         
         # Zrušení linku
-        if (event.key() == Qt.Key_Escape 
+        if (k == Qt.Key_Escape 
                 and self.mode == Mode.ADD_LINK 
                 and self.pending_link_src is not None):
             self.cancel_link_creation()
@@ -1194,31 +1332,31 @@ class MainWindow(QMainWindow):
             return
         
         # Rychlé přepínání módu
-        if event.key() == Qt.Key_P:
+        if k == Qt.Key_P:
             # P = Přidat proces
             self.set_mode(Mode.ADD_PROCESS)
             event.accept()
             return
         
-        if event.key() == Qt.Key_O:
+        if k == Qt.Key_O:
             # O = Přidat objekt
             self.set_mode(Mode.ADD_OBJECT)
             event.accept()
             return
         
-        if event.key() == Qt.Key_L:
+        if k == Qt.Key_L:
             # L = Přidat link
             self.set_mode(Mode.ADD_LINK)
             event.accept()
             return
         
-        if event.key() == Qt.Key_S:
+        if k == Qt.Key_S:
             # S = Select tool
             self.set_mode(Mode.SELECT)
             event.accept()
             return
         
-        if event.key() == Qt.Key_T:
+        if k == Qt.Key_T:
             # T = Toggle token na vybraných objektech/stavech
             sel = self.scene.selectedItems()
             from graphics.nodes import ObjectItem, StateItem
@@ -1238,30 +1376,5 @@ class MainWindow(QMainWindow):
                     event.accept()
                     return
         
-        # Rychlé přepínání typu linku čísly
-        if event.key() in (Qt.Key_1, Qt.Key_2, Qt.Key_3, Qt.Key_4):
-            mapping = {
-                Qt.Key_1: "consumption/result",
-                Qt.Key_2: "effect",
-                Qt.Key_3: "agent",
-                Qt.Key_4: "instrument",
-            }
-            lt = mapping.get(event.key())
-            sel = [it for it in self.scene.selectedItems() if isinstance(it, LinkItem)]
-            
-            if sel:
-                for ln in sel:
-                    # Pokud je to consumption/result, převedeme na konkrétní typ podle zdroje a cíle
-                    resolved_type = self._resolve_link_type(ln.src, ln.dst, lt)
-                    ln.set_link_type(resolved_type)
-                self.update_properties_panel()
-            else:
-                # Když není nic vybráno, nastaví se default pro další link
-                self.default_link_type = lt
-                self.cmb_default_link_type.setCurrentText(lt)
-
-            event.accept()
-            return
-        
         super().keyPressEvent(event)
 
@@ -1,5 +1,8 @@
 """Properties panel widget pro OPM Editor."""
+import logging
+
 from PySide6.QtCore import Qt
+from PySide6.QtGui import QStandardItem, QStandardItemModel
 from PySide6.QtWidgets import (
     QDockWidget,
     QWidget,
@@ -11,10 +14,40 @@ from PySide6.QtWidgets import (
     QCheckBox,
     QMessageBox,
 )
-from constants import LINK_TYPES
+from constants import LINK_TYPES, STRUCTURAL_TYPES
 from graphics.nodes import ObjectItem, ProcessItem, StateItem
 from graphics.link import LinkItem
 
+log = logging.getLogger(__name__)
+
+# Položky comba typu linku: nadpisy skupin (nevybratelné), None = oddělovač
+_LINK_TYPE_ITEMS = (
+    "─── Procedural ───",
+    "consumption/result", "effect", "agent", "instrument", "invocation",
+    None,
+    "─── Structural ───",
+    "aggregation", "exhibition", "generalization", "instantiation",
+)
+
+
+def _build_link_type_model(parent) -> QStandardItemModel:
+    """Sestaví model comba typu linku naráz (jedno vložení řádků)."""
+    rows = []
+    for text in _LINK_TYPE_ITEMS:
+        if text is None:
+            # Stejná reprezentace oddělovače jako QComboBox.insertSeparator
+            item = QStandardItem()
+            item.setData("separator", Qt.AccessibleDescriptionRole)
+            item.setFlags(Qt.NoItemFlags)
+        else:
+            item = QStandardItem(text)
+            if text.startswith("───"):
+                item.setEnabled(False)  # Zakáže výběr nadpisu
+        rows.append(item)
+    model = QStandardItemModel(parent)
+    model.appendColumn(rows)
+    return model
+
 
 class PropertiesPanel(QDockWidget):
     """Dock widget pro zobrazení a úpravu vlastností vybraných prvků."""
@@ -60,21 +93,8 @@ class PropertiesPanel(QDockWidget):
         # typ linku
         self.lbl_link_type = QLabel("Link type", self.panel_props)
         self.cmb_link_type = QComboBox(self.panel_props)
-        
-        # Přidej procedurální linky
-        self.cmb_link_type.addItem("─── Procedural ───")
-        self.cmb_link_type.model().item(0).setEnabled(False)  # Zakáže výběr nadpisu
-        self.cmb_link_type.addItems([
-            "consumption/result", "effect", "agent", "instrument", "invocation"
-        ])
-        
-        # Přidej oddělovač a strukturální linky
-        self.cmb_link_type.insertSeparator(6)  # Po 5 procedurálních + 1 nadpis
-        self.cmb_link_type.addItem("─── Structural ───")
-        self.cmb_link_type.model().item(7).setEnabled(False)  # Zakáže výběr nadpisu
-        self.cmb_link_type.addItems([
-            "aggregation", "exhibition", "generalization", "instantiation"
-        ])
+        # Procedurální linky, oddělovač a strukturální linky
+        self.cmb_link_type.setModel(_build_link_type_model(self.cmb_link_type))
         
         self.cmb_link_type.currentTextChanged.connect(self._on_link_type_changed)
         form.addRow(self.lbl_link_type, self.cmb_link_type)
@@ -101,154 +121,144 @@ class PropertiesPanel(QDockWidget):
 
         # OPL tlačítko odstraněno - přesunuto do OPL menu v toolbaru jako "Export OPL"
 
+        # Skupiny řádků formuláře podle typu vybraného prvku
+        label_rows = (self.lbl_label, self.ed_label)
+        self._node_rows = label_rows + (
+            self.lbl_essence, self.cmb_essence, self.lbl_affiliation, self.cmb_affiliation)
+        self._token_rows = (self.lbl_token, self.chk_token)
+        self._state_rows = label_rows + (self.lbl_state_kind, self.cmb_state_kind) + self._token_rows
+        self._link_rows = label_rows + (self.lbl_link_type, self.cmb_link_type)
+        self._card_rows = (self.lbl_card_src, self.ed_card_src, self.lbl_card_dst, self.ed_card_dst)
+        self._all_rows = (
+            self._node_rows + self._token_rows + self._link_rows[2:]
+            + (self.lbl_state_kind, self.cmb_state_kind) + self._card_rows
+        )
+        # Editory, jejichž hodnotu panel nastavuje programově podle výběru
+        self._value_widgets = (
+            self.ed_label, self.cmb_essence, self.cmb_affiliation, self.cmb_state_kind,
+            self.cmb_link_type, self.ed_card_src, self.ed_card_dst, self.chk_token,
+        )
+
         self.panel_props.setLayout(form)
         self.setWidget(self.panel_props)
     
-    def update_for_selection(self):
-        """Aktualizuje panel na základě aktuálního výběru."""
-        it = self._get_selected_item()
+    def update_for_selection(self, sel=None):
+        """Aktualizuje panel na základě aktuálního výběru.
         
-        print(f"[Properties] Updating for selection: {type(it).__name__ if it else 'None'}")
+        Args:
+            sel: Již zjištěný seznam vybraných prvků (jinak se zjistí ze scény)
+        """
+        if sel is None and self.main_window and hasattr(self.main_window, 'scene'):
+            sel = self.main_window.scene.selectedItems()
+        it = self._get_selected_item(sel)
         
-        # defaultně schováme vše, co nemá být vidět
-        self.lbl_label.hide()
-        self.ed_label.hide()
-        self.lbl_essence.hide()
-        self.cmb_essence.hide()
-        self.lbl_affiliation.hide()
-        self.cmb_affiliation.hide()
-        self.lbl_link_type.hide()
-        self.cmb_link_type.hide()
-        self.lbl_state_kind.hide()
-        self.cmb_state_kind.hide()
-        self.ed_card_src.hide()
-        self.ed_card_dst.hide()
-        self.lbl_card_src.hide()
-        self.lbl_card_dst.hide()
-        self.lbl_token.hide()
-        self.chk_token.hide()
-
-        if isinstance(it, ObjectItem):
-            # Objekt → má label + essence + affiliation + token
-            print(f"[Properties] Showing properties for {it.label}")
-            self.lbl_label.show()
-            self.ed_label.show()
-            self.ed_label.setEnabled(True)
-            self.ed_label.setText(it.label)
-            
-            self.lbl_essence.show()
-            self.cmb_essence.show()
-            self.cmb_essence.setCurrentText(it.essence)
-            
-            self.lbl_affiliation.show()
-            self.cmb_affiliation.show()
-            self.cmb_affiliation.setCurrentText(it.affiliation)
+        log.debug("Updating for selection: %s", type(it).__name__ if it else None)
+        
+        visible = set()  # Widgety, které mají být pro daný prvek vidět
+        
+        # Panel se překreslí a přepočítá layout jen jednou na konci.
+        # Nastavení hodnot nesmí spustit handlery, které by měnily vybraný prvek.
+        self.panel_props.setUpdatesEnabled(False)
+        for w in self._value_widgets:
+            w.blockSignals(True)
+        try:
+            if self.main_window:
+                self._sync_link_type_combo(sel or [])
             
-            # Token jen pro objekty bez stavů
-            states = [ch for ch in it.childItems() if isinstance(ch, StateItem)]
-            if not states:
-                self.lbl_token.show()
-                self.chk_token.show()
-                self.chk_token.setChecked(getattr(it, 'has_token', False))
+            handler = self._populate_handler(it)
+            if handler is not None:
+                handler(self, it, visible)
             else:
-                self.lbl_token.hide()
-                self.chk_token.hide()
-        elif isinstance(it, ProcessItem):
-            # Proces → má label + essence + affiliation (bez tokenu)
-            print(f"[Properties] Showing properties for {it.label}")
-            self.lbl_label.show()
-            self.ed_label.show()
-            self.ed_label.setEnabled(True)
-            self.ed_label.setText(it.label)
-            
-            self.lbl_essence.show()
-            self.cmb_essence.show()
-            self.cmb_essence.setCurrentText(it.essence)
+                log.debug("No item selected or unsupported type")
+                self.ed_label.clear()
             
-            self.lbl_affiliation.show()
-            self.cmb_affiliation.show()
-            self.cmb_affiliation.setCurrentText(it.affiliation)
-        elif isinstance(it, StateItem):
-            # Stav → má label + druh + token
-            print(f"[Properties] Showing properties for state {it.label}")
-            self.lbl_label.show()
-            self.ed_label.show()
-            self.ed_label.setEnabled(True)
-            self.ed_label.setText(it.label)
-
-            self.lbl_state_kind.show()
-            self.cmb_state_kind.show()
-            self.cmb_state_kind.setCurrentText(getattr(it, "state_kind", "standard"))
-            
-            self.lbl_token.show()
-            self.chk_token.show()
+            # Jeden průchod místo schování všeho a opětovného zobrazení
+            for w in self._all_rows:
+                w.setVisible(w in visible)
+        finally:
+            for w in self._value_widgets:
+                w.blockSignals(False)
+            self.panel_props.setUpdatesEnabled(True)
+    
+    @staticmethod
+    def _populate_handler(it):
+        """Vrátí funkci, která naplní panel pro daný typ prvku (nebo None)."""
+        handler = _POPULATE_HANDLERS.get(type(it))
+        if handler is None and it is not None:
+            # Podtřídy známých typů (přesná shoda typu je běžný případ)
+            for cls, fn in _POPULATE_HANDLERS.items():
+                if isinstance(it, cls):
+                    return fn
+        return handler
+    
+    def _populate_node(self, it, visible: set):
+        """Objekt/proces → má label + essence + affiliation (objekt i token)."""
+        log.debug("Showing properties for %s", it.label)
+        visible.update(self._node_rows)
+        self.ed_label.setEnabled(True)
+        self.ed_label.setText(it.label)
+        self.cmb_essence.setCurrentText(it.essence)
+        self.cmb_affiliation.setCurrentText(it.affiliation)
+        
+        # Token jen pro objekty bez stavů
+        if isinstance(it, ObjectItem) and not any(
+                isinstance(ch, StateItem) for ch in it.childItems()):
+            visible.update(self._token_rows)
             self.chk_token.setChecked(getattr(it, 'has_token', False))
-        elif isinstance(it, LinkItem):
-            # Link → má label + typ + kardinalitu
-            print(f"[Properties] Showing properties for link")
-            self.lbl_label.show()
-            self.ed_label.show()
-            self.ed_label.setEnabled(True)
-            self.ed_label.setText(it.label)
-            
-            self.lbl_link_type.show()
-            self.cmb_link_type.show()
-            # Pokud je to consumption nebo result, zobrazíme jako consumption/result
-            display_type = it.link_type
-            if it.link_type in ("consumption", "result"):
-                display_type = "consumption/result"
-            self.cmb_link_type.setCurrentText(display_type)
-            
-            # Kardinality jen pro určité typy linků
-            if it.link_type in {"aggregation", "exhibition", "generalization", "instantiation"}:
-                self.lbl_card_src.show()
-                self.ed_card_src.show()
-                self.lbl_card_dst.show()
-                self.ed_card_dst.show()
-                self.ed_card_src.setText(it.card_src)
-                self.ed_card_dst.setText(it.card_dst)
-        else:
-            print(f"[Properties] No item selected or unsupported type")
     
-    def sync_selection_to_props(self):
-        """Synchronizuje výběr do properties panelu."""
-        if not self.main_window:
-            return
-            
-        sel = self.main_window.scene.selectedItems()
-        it = sel[0] if sel else None
+    def _populate_state(self, it, visible: set):
+        """Stav → má label + druh + token."""
+        log.debug("Showing properties for state %s", it.label)
+        visible.update(self._state_rows)
+        self.ed_label.setEnabled(True)
+        self.ed_label.setText(it.label)
+        self.cmb_state_kind.setCurrentText(getattr(it, "state_kind", "standard"))
+        self.chk_token.setChecked(getattr(it, 'has_token', False))
+    
+    def _populate_link(self, it, visible: set):
+        """Link → má label + typ + kardinalitu."""
+        log.debug("Showing properties for link")
+        visible.update(self._link_rows)
+        self.ed_label.setEnabled(True)
+        self.ed_label.setText(it.label)
         
-        if isinstance(it, (ObjectItem, ProcessItem, StateItem)):
-            self.ed_label.setText(it.label)
-        elif isinstance(it, LinkItem):
-            self.ed_label.setText(it.label)
-        else:
-            self.ed_label.clear()
-            
-        links = [x for x in sel if isinstance(x, LinkItem)]
-        self.main_window._suppress_combo = True
-        if links:
+        # Pokud je to consumption nebo result, zobrazíme jako consumption/result
+        display_type = it.link_type
+        if it.link_type in ("consumption", "result"):
+            display_type = "consumption/result"
+        self.cmb_link_type.setCurrentText(display_type)
+        
+        # Kardinality jen pro určité typy linků
+        if it.link_type in STRUCTURAL_TYPES:
+            visible.update(self._card_rows)
+            self.ed_card_src.setText(it.card_src)
+            self.ed_card_dst.setText(it.card_dst)
+    
+    def _sync_link_type_combo(self, sel):
+        """Nastaví combo typu linku podle prvního vybraného linku, jinak výchozí typ."""
+        link = next((x for x in sel if isinstance(x, LinkItem)), None)
+        if link is not None:
             # Pokud je to consumption nebo result, zobrazíme jako consumption/result
-            display_type = links[0].link_type
-            if links[0].link_type in ("consumption", "result"):
+            display_type = link.link_type
+            if link.link_type in ("consumption", "result"):
                 display_type = "consumption/result"
             self.cmb_link_type.setCurrentText(display_type)
             self.lbl_link_type.setText("Link type (selected links)")
         else:
             self.cmb_link_type.setCurrentText(self.main_window.default_link_type)
             self.lbl_link_type.setText("Link type (for new links)")
-        self.main_window._suppress_combo = False
     
-    def _get_selected_item(self):
+    def _get_selected_item(self, sel=None):
         """Vrátí první vybraný prvek nebo None."""
+        if sel is not None:
+            return sel[0] if sel else None
         if not self.main_window:
-            print("[Properties] No main_window!")
+            log.debug("No main_window")
             return None
         if not hasattr(self.main_window, 'scene'):
-            print("[Properties] main_window has no scene!")
+            log.debug("main_window has no scene")
             return None
         sel = self.main_window.scene.selectedItems()
-        print(f"[Properties] Selected items count: {len(sel)}")
         return sel[0] if sel else None
     
     def _on_label_changed(self):
@@ -368,3 +378,11 @@ class PropertiesPanel(QDockWidget):
             resolved_type = self.main_window._resolve_link_type(ln.src, ln.dst, text)
             ln.set_link_type(resolved_type)
 
+
+# Typ vybraného prvku → funkce, která pro něj naplní panel
+_POPULATE_HANDLERS = {
+    ObjectItem: PropertiesPanel._populate_node,
+    ProcessItem: PropertiesPanel._populate_node,
+    StateItem: PropertiesPanel._populate_state,
+    LinkItem: PropertiesPanel._populate_link,
+}
@@ -1,8 +1,9 @@
 """Panel pro ovládání simulace OPM diagramu."""
 from __future__ import annotations
 from typing import Optional, Dict, List, Tuple
-import io
-from PySide6.QtCore import Qt, QTimer, QRectF, QBuffer, QIODevice
+from contextlib import ExitStack
+import logging
+from PySide6.QtCore import Qt, QTimer, QRectF, QObject, QRunnable, QThreadPool, Signal
 from PySide6.QtGui import QImage, QPainter
 from PySide6.QtWidgets import (
     QDockWidget,
@@ -19,10 +20,65 @@ from PySide6.QtWidgets import (
     QSpinBox,
     QFileDialog,
     QMessageBox,
+    QGraphicsView,
 )
+from graphics.nodes import ObjectItem, ProcessItem, StateItem
+from persistence.json_io import safe_base_filename
 from simulation.simulator import SimulationEngine
 from simulation.petri_net import Place
 
+log = logging.getLogger(__name__)
+
+# Pillow (volitelná závislost pro export GIFu) se načte až při prvním exportu
+_pil_image = None
+
+
+def _get_pil_image():
+    """Vrátí modul PIL.Image, nebo None, pokud Pillow není nainstalovaný."""
+    global _pil_image
+    if _pil_image is None:
+        try:
+            from PIL import Image
+        except ImportError:
+            return None
+        _pil_image = Image
+    return _pil_image
+
+
+class _GifSaveSignals(QObject):
+    """Signály úlohy ukládání GIFu (QRunnable sám signály mít nemůže)."""
+    finished = Signal(str, int, str)  # cesta, počet snímků, chybová zpráva ("" = úspěch)
+
+
+class _GifSaveTask(QRunnable):
+    """Zakóduje a uloží nahrané snímky do GIFu mimo UI vlákno."""
+    
+    def __init__(self, path: str, frames: list, duration_ms: int, signals: _GifSaveSignals):
+        super().__init__()
+        # Úlohu po doběhnutí run() smaže thread pool (autoDelete); panel drží jen signály
+        self.path = path
+        self.frames = frames  # úloha snímky přebírá, panel je už nepoužívá
+        self.duration_ms = duration_ms
+        self.signals = signals
+    
+    def run(self):
+        frame_count = len(self.frames)
+        error = ""
+        try:
+            # Pillow používá duration v milisekundách
+            self.frames[0].save(
+                self.path,
+                save_all=True,
+                append_images=self.frames[1:],
+                duration=self.duration_ms,
+                loop=0
+            )
+        except Exception as e:
+            error = str(e)
+        finally:
+            self.frames = []
+        self.signals.finished.emit(self.path, frame_count, error)
+
 
 class SimulationPanel(QDockWidget):
     """Dock widget pro ovládání simulace."""
@@ -33,6 +89,20 @@ class SimulationPanel(QDockWidget):
         self.simulator: Optional[SimulationEngine] = None
         self.token_checkboxes: Dict[str, QCheckBox] = {}  # place_id -> checkbox
         self.net_enabled = False  # Flag pro to, zda je Petriho síť aktivní
+        # Procesy ve scéně simulace podle node_id (sestaví se při Build/Reset)
+        self._process_items_by_id: Dict[str, ProcessItem] = {}
+        # Naposledy vykreslené označení - při změně se překreslí jen změněná místa
+        self._last_marking: Dict[str, bool] = {}
+        self._token_refresh_pending = False
+        # True během programové synchronizace checkboxů - změny se nepromítají do sítě
+        self._syncing_checkboxes = False
+        # Signály ukládání GIFu - bez Qt rodiče, panel je drží po celou dobu života,
+        # takže úloha v poolu nikdy neemituje na smazaný objekt; úlohu vlastní thread pool
+        self._gif_save_signals = _GifSaveSignals()
+        self._gif_save_signals.finished.connect(self._on_gif_saved)
+        self._gif_saving = False  # True od předání snímků úloze do doběhnutí _on_gif_saved
+        # True během nahrávání GIFu - panel (checkboxy, seznamy) se neobnovuje, jen scéna
+        self._exporting = False
         self._init_ui()
         
     def _init_ui(self):
@@ -154,7 +224,7 @@ class SimulationPanel(QDockWidget):
     def _on_build_reset(self):
         """Vytvoří Petriho síť z diagramu a resetuje simulaci."""
         if not self.main_window or not self.main_window.scene:
-            print("[UI] WARNING: Cannot build - no main_window or scene")
+            log.warning("Cannot build - no main_window or scene")
             return
         
         # Vždy aktualizujeme referenci na scénu (může se změnit po importu JSONu)
@@ -165,20 +235,24 @@ class SimulationPanel(QDockWidget):
             # Aktualizujeme referenci na scénu (může se změnit po importu)
             self.simulator.scene = self.main_window.scene
         
-        print(f"[UI] Building Petri net. Scene has {len(self.main_window.scene.items())} items")
         
         # Vytvoří nebo obnoví síť
         self.simulator.build_net()
         
         if not self.simulator.net:
-            print("[UI] ERROR: Failed to build Petri net")
+            log.error("Failed to build Petri net")
             self.lbl_status.setText("Status: Build failed")
             self.net_enabled = False
             self.btn_disable.setEnabled(False)
             return
         
-        print(f"[UI] Petri net built: {len(self.simulator.net.places)} places, {len(self.simulator.net.transitions)} transitions")
-        print(f"[UI] Place mapping: {len(self.simulator.place_to_items)} mappings")
+        log.debug("Petri net built: %d places, %d transitions, %d place mappings",
+                  len(self.simulator.net.places), len(self.simulator.net.transitions),
+                  len(self.simulator.place_to_items))
+        
+        self._index_process_items()
+        # Nová síť - první aktualizace musí projít všechna místa
+        self._last_marking = {}
         
         self.net_enabled = True
         self.lbl_status.setText("Status: Built")
@@ -187,11 +261,13 @@ class SimulationPanel(QDockWidget):
         self.btn_export_gif.setEnabled(True)
         self.btn_disable.setEnabled(True)
         self._build_tokens_list()
+        # Nová síť může mít jiné přechody se stejnými ID (např. přejmenované procesy)
+        for widget in (self.list_enabled, self.list_waiting, self.list_blocked):
+            widget.clear()
         
         # Resetuje tokeny na prázdné (build_net už volá reset(), ale pro jistotu)
         if self.simulator.net:
-            for place_id in self.simulator.net.places.keys():
-                self.simulator.net.set_token(place_id, False)
+            self.simulator.net.clear_marking()
             if hasattr(self, 'marking_changed'):
                 self.marking_changed()
         
@@ -215,20 +291,16 @@ class SimulationPanel(QDockWidget):
         
         # Resetuj tokeny - odeber všechny tokeny
         if self.simulator and self.simulator.net:
-            for place_id in self.simulator.net.places.keys():
-                self.simulator.net.set_token(place_id, False)
+            self.simulator.net.clear_marking()
             
             # Aktualizuj vizualizaci tokenů
             marking = self.simulator.get_marking()
             for place_id, has_token in marking.items():
                 items = self.simulator.place_to_items.get(place_id, [])
                 for item in items:
-                    if hasattr(item, 'has_token'):
-                        item.has_token = has_token
-                        if item.scene():
-                            scene_rect = item.mapToScene(item.boundingRect()).boundingRect()
-                            item.scene().update(scene_rect)
-                        item.update()
+                    item.has_token = has_token
+                    item.update()
+            self._last_marking = marking
         
         # Aktualizuj barvy procesů (všechny budou bílé)
         self._update_process_colors()
@@ -267,73 +339,82 @@ class SimulationPanel(QDockWidget):
         if not self.simulator or not self.simulator.net:
             return
             
-        # Aktualizuj vizualizaci tokenů
+        # Aktualizuj vizualizaci tokenů - jen u míst, jejichž token se změnil
         marking = self.simulator.get_marking()
+        last = self._last_marking
+        changed = [pid for pid, has_token in marking.items() if last.get(pid) != has_token]
+        self._last_marking = marking
+        if not changed:
+            # Stejné označení jako minule - tokeny, barvy procesů ani seznamy přechodů se nemění
+            return
         
-        for place_id, has_token in marking.items():
-            place = self.simulator.net.places.get(place_id)
+        places = self.simulator.net.places
+        mapping = self.simulator.place_to_items
+        for place_id in changed:
+            has_token = marking[place_id]
+            place = places.get(place_id)
             if not place:
                 continue
                 
             # Najdi grafické prvky pro toto místo
-            items = self.simulator.place_to_items.get(place_id, [])
+            items = mapping.get(place_id)
             if not items:
-                print(f"[UI] WARNING: No items found for place {place_id} ({place.label})")
+                log.debug("No items found for place %s (%s), rebuilding mapping", place_id, place.label)
                 # Zkusme znovu vytvořit mapování pro tento place
                 # (může se stát, že se přidaly stavy po vytvoření sítě)
                 self.simulator._build_place_mapping()
-                items = self.simulator.place_to_items.get(place_id, [])
-                if items:
-                    print(f"[UI] Rebuilt mapping, found {len(items)} items")
-                else:
-                    print(f"[UI] Still no items after rebuild, skipping")
+                mapping = self.simulator.place_to_items  # přestavba vytvoří nový slovník
+                items = mapping.get(place_id)
+                if not items:
                     continue
-            else:
-                print(f"[UI] Updating token for place {place_id} ({place.label}): has_token={has_token}, items={len(items)}")
             
             # Kontrola: pokud má place state_label=None, ale objekt má stavy, varování
-            if place.state_label is None and items:
-                from graphics.nodes import ObjectItem, StateItem
+            if place.state_label is None and log.isEnabledFor(logging.WARNING):
                 for item in items:
-                    if isinstance(item, ObjectItem):
-                        states = [ch for ch in item.childItems() if isinstance(ch, StateItem)]
-                        if states:
-                            print(f"[UI] WARNING: Place {place_id} is for object without states, but object '{item.label}' has {len(states)} states. Please press Reset to rebuild the network.")
+                    if isinstance(item, ObjectItem) and any(
+                            isinstance(ch, StateItem) for ch in item.childItems()):
+                        log.warning("Place %s is for object without states, but object '%s' has states. "
+                                    "Please press Reset to rebuild the network.", place_id, item.label)
             
+            # place_to_items obsahuje jen ObjectItem/StateItem, oba mají has_token
             for item in items:
-                if hasattr(item, 'has_token'):
-                    from graphics.nodes import ObjectItem, StateItem
-                    item_type = "StateItem" if isinstance(item, StateItem) else "ObjectItem" if isinstance(item, ObjectItem) else "Unknown"
-                    print(f"[UI] Setting has_token={has_token} on {item_type} '{item.label if hasattr(item, 'label') else 'N/A'}'")
-                    item.has_token = has_token
-                    # Přinutíme aktualizaci scény
-                    # Pro child items (např. StateItem) musíme použít mapToScene
-                    # aby se správně aktualizovala oblast ve scénových souřadnicích
-                    if item.scene():
-                        # Získej bounding rect ve scénových souřadnicích
-                        scene_rect = item.mapToScene(item.boundingRect()).boundingRect()
-                        item.scene().update(scene_rect)
-                    item.update()  # Překresli
+                item.has_token = has_token
+                # update() zneplatní cache vykreslení prvku a sám označí jeho oblast
+                # ve scénových souřadnicích (i pro child items jako StateItem);
+                # scéna pak všechny oblasti překreslí najednou
+                item.update()
         
         # Aktualizuj barvy procesů
         self._update_process_colors()
         
+        if self._exporting:
+            # Snímky GIFu zachycují jen scénu; panel se srovná po obnovení počátečního stavu
+            return
+        
         # Aktualizujeme checkboxy (bez emitování signálu, aby se nezacyklil)
-        self._update_token_checkboxes_silent()
+        self._update_token_checkboxes_silent(changed, marking)
         self._update_lists()
     
+    def _index_process_items(self):
+        """Sestaví mapování node_id → ProcessItem pro scénu simulace (jeden průchod scénou)."""
+        self._process_items_by_id = {
+            item.node_id: item for item in self.simulator.scene.items()
+            if isinstance(item, ProcessItem)
+        }
+    
+    def _live_process_items(self):
+        """Vrátí indexované procesy, které jsou stále ve scéně simulace."""
+        scene = self.simulator.scene
+        return (item for item in self._process_items_by_id.values() if item.scene() is scene)
+    
     def _update_process_colors(self):
         """Aktualizuje barvy všech procesů podle jejich stavu v Petriho síti."""
-        from graphics.nodes import ProcessItem
         if not self.simulator or not self.simulator.scene:
             return
         
-        for item in self.simulator.scene.items():
-            if isinstance(item, ProcessItem):
-                if item.scene():
-                    scene_rect = item.mapToScene(item.boundingRect()).boundingRect()
-                    item.scene().update(scene_rect)
-                item.update()  # Překresli pro aktualizaci barvy
+        # Procesy přidané po sestavení sítě v ní nejsou, jejich barva se nemění
+        for item in self._live_process_items():
+            item.update()  # Překresli pro aktualizaci barvy
     
     def marking_changed(self):
         """Wrapper pro emitování signálu marking_changed."""
@@ -352,112 +433,123 @@ class SimulationPanel(QDockWidget):
         # transition_id má formát "transition_{node_id}"
         if transition_id.startswith("transition_"):
             process_node_id = transition_id.replace("transition_", "")
-            from graphics.nodes import ProcessItem
             
             # Najdi ProcessItem s odpovídajícím node_id
             if self.simulator and self.simulator.scene:
-                for item in self.simulator.scene.items():
-                    if isinstance(item, ProcessItem) and item.node_id == process_node_id:
-                        item.start_animation()
-                        break
+                item = self._process_items_by_id.get(process_node_id)
+                if item is not None and item.scene() is self.simulator.scene:
+                    item.start_animation()
             
     def _update_lists(self):
         """Aktualizuje seznamy aktivních, čekajících a blokovaných přechodů."""
         if not self.simulator or not self.simulator.net:
             return
             
-        # Získáme všechny seznamy
-        enabled = self.simulator.get_enabled_transitions()
-        fireable = self.simulator.get_fireable_transitions()
-        blocked = self.simulator.get_blocked_transitions()
-        waiting = self.simulator.get_waiting_transitions()
+        # Získáme všechny seznamy jedním průchodem přechodů
+        enabled, fireable, blocked, waiting = self.simulator.get_transition_states()
         
-        print(f"[UI] Enabled transitions: {enabled}")
-        print(f"[UI] Fireable transitions: {fireable}")
-        print(f"[UI] Blocked transitions: {blocked}")
-        print(f"[UI] Waiting transitions: {waiting}")
+        log.debug("Transitions: enabled=%s fireable=%s blocked=%s waiting=%s",
+                  enabled, fireable, blocked, waiting)
         
         # Aktualizuj seznam aktivních přechodů (jen ty, které mohou proběhnout)
-        self.list_enabled.clear()
-        for tid in fireable:
-            transition = self.simulator.net.transitions.get(tid)
-            if transition:
-                item = QListWidgetItem(transition.label)
-                item.setForeground(Qt.green)  # Zeleně pro ready-to-fire
-                self.list_enabled.addItem(item)
-        
+        self._sync_transition_list(self.list_enabled, fireable, Qt.green)  # Zeleně pro ready-to-fire
         # Aktualizuj seznam čekajících přechodů (čekají na vstupy)
-        self.list_waiting.clear()
-        for tid in waiting:
-            transition = self.simulator.net.transitions.get(tid)
-            if transition:
-                item = QListWidgetItem(transition.label)
-                item.setForeground(Qt.darkYellow)  # Žlutě pro čekající
-                self.list_waiting.addItem(item)
-                
+        self._sync_transition_list(self.list_waiting, waiting, Qt.darkYellow)  # Žlutě pro čekající
         # Aktualizuj seznam blokovaných přechodů (procesní zádrhely)
-        self.list_blocked.clear()
-        for tid in blocked:
-            transition = self.simulator.net.transitions.get(tid)
-            if transition:
-                item = QListWidgetItem(transition.label)
-                item.setForeground(Qt.red)  # Červeně pro zádrhely
-                self.list_blocked.addItem(item)
+        self._sync_transition_list(self.list_blocked, blocked, Qt.red)  # Červeně pro zádrhely
         
         # Aktualizuj barvy procesů po změně seznamů
         self._update_process_colors()
-                
-        # Pokud není žádný blokovaný, ale jsou enabled, zobrazíme informaci
-        if not blocked and enabled:
-            print(f"[UI] All enabled transitions are fireable (no bottlenecks)")
-        elif not blocked and not enabled:
-            print(f"[UI] No enabled transitions")
+    
+    def _sync_transition_list(self, widget: QListWidget, tids: List[str], color) -> None:
+        """Aktualizuje seznam přechodů jen o rozdíly proti aktuálnímu obsahu.
+        
+        Položky nesou ID přechodu v Qt.UserRole; odeberou se ty, které už v tids nejsou,
+        a na konec se přidají nové. Ostatní položky zůstanou beze změny.
+        """
+        wanted = set(tids)
+        present = set()
+        transitions = self.simulator.net.transitions
+        widget.setUpdatesEnabled(False)
+        try:
+            for row in range(widget.count() - 1, -1, -1):
+                tid = widget.item(row).data(Qt.UserRole)
+                if tid in wanted:
+                    present.add(tid)
+                else:
+                    widget.takeItem(row)
+            for tid in tids:
+                if tid in present:
+                    continue
+                transition = transitions.get(tid)
+                if transition:
+                    item = QListWidgetItem(transition.label)
+                    item.setForeground(color)
+                    item.setData(Qt.UserRole, tid)
+                    widget.addItem(item)
+        finally:
+            widget.setUpdatesEnabled(True)
     
     def _build_tokens_list(self):
         """Vytvoří seznam checkboxů pro nastavení počátečních tokenů."""
         if not self.simulator or not self.simulator.net:
             return
             
-        # Odstraníme staré checkboxy
-        for checkbox in self.token_checkboxes.values():
-            self.tokens_layout.removeWidget(checkbox)
-            checkbox.deleteLater()
-        self.token_checkboxes.clear()
+        places_map = self.simulator.net.places
         
         # Seskupte místa podle objektu pro lepší organizaci
         places_by_object: Dict[str, List[Tuple[str, Place]]] = {}
-        for place_id, place in self.simulator.net.places.items():
+        for place_id, place in places_map.items():
             obj_id = place.object_id
             if obj_id not in places_by_object:
                 places_by_object[obj_id] = []
             places_by_object[obj_id].append((place_id, place))
         
-        print(f"[UI] Building token checkboxes for {len(self.simulator.net.places)} places across {len(places_by_object)} objects")
+        log.debug("Building token checkboxes for %d places across %d objects",
+                  len(places_map), len(places_by_object))
         
-        # Vytvoříme checkboxy seskupené podle objektu
-        # Seřadíme objekty podle názvu
-        for obj_id in sorted(places_by_object.keys(), key=lambda oid: places_by_object[oid][0][1].label.split(" at state")[0]):
+        # Pořadí checkboxů: objekty podle názvu, v rámci objektu nejdřív místo bez stavu, pak stavy
+        ordered: List[Tuple[str, Place]] = []
+        # Klíč řazení (název objektu) spočítáme jednou pro každý objekt
+        sort_keys = {oid: ps[0][1].label.split(" at state", 1)[0] for oid, ps in places_by_object.items()}
+        for obj_id in sorted(places_by_object, key=sort_keys.__getitem__):
             places = places_by_object[obj_id]
-            # Seřadíme místa - nejdřív objekt bez stavu, pak stavy
             places.sort(key=lambda p: (p[1].state_label is None, p[1].state_label or ""))
-            
-            for place_id, place in places:
-                checkbox = QCheckBox(place.label, self.tokens_widget)
-                checkbox.setChecked(False)  # Výchozí: žádný token
-                # Připojíme signál pro automatické nastavení tokenu při změně
-                checkbox.stateChanged.connect(
-                    lambda checked, pid=place_id: self._on_token_checkbox_changed(pid, checked)
-                )
-                self.token_checkboxes[place_id] = checkbox
-                self.tokens_layout.insertWidget(self.tokens_layout.count() - 1, checkbox)  # Před stretch
-                print(f"[UI] Added checkbox for place {place_id}: {place.label}")
+            ordered.extend(places)
+        
+        # Checkboxy měníme jen pro rozdíl oproti minulé síti - při opakovaném
+        # Build/Reset je většina míst stejná a mazání/vytváření widgetů je drahé
+        self.tokens_widget.setUpdatesEnabled(False)
+        try:
+            for place_id in set(self.token_checkboxes) - set(places_map):
+                checkbox = self.token_checkboxes.pop(place_id)
+                self.tokens_layout.removeWidget(checkbox)
+                checkbox.deleteLater()
+            
+            for index, (place_id, place) in enumerate(ordered):
+                checkbox = self.token_checkboxes.get(place_id)
+                if checkbox is None:
+                    checkbox = QCheckBox(place.label, self.tokens_widget)
+                    # Připojíme signál pro automatické nastavení tokenu při změně
+                    checkbox.stateChanged.connect(
+                        lambda checked, pid=place_id: self._on_token_checkbox_changed(pid, checked)
+                    )
+                    self.token_checkboxes[place_id] = checkbox
+                elif checkbox.text() != place.label:
+                    checkbox.setText(place.label)
+                # Přesuneme widget jen pokud není na správné pozici (stretch zůstává poslední)
+                layout_item = self.tokens_layout.itemAt(index)
+                if layout_item is None or layout_item.widget() is not checkbox:
+                    self.tokens_layout.removeWidget(checkbox)
+                    self.tokens_layout.insertWidget(index, checkbox)
+        finally:
+            self.tokens_widget.setUpdatesEnabled(True)
             
         self.group_tokens.setVisible(len(self.token_checkboxes) > 0)
-        print(f"[UI] Total checkboxes created: {len(self.token_checkboxes)}")
     
     def _on_token_checkbox_changed(self, place_id: str, checked: int):
         """Automaticky nastaví token při změně checkboxu."""
-        if not self.simulator or not self.simulator.net:
+        if self._syncing_checkboxes or not self.simulator or not self.simulator.net:
             return
             
         # checked je Qt.Checked (2) nebo Qt.Unchecked (0)
@@ -466,43 +558,70 @@ class SimulationPanel(QDockWidget):
         # Nastavíme token v místě
         self.simulator.net.set_token(place_id, has_token)
         
-        # Aktualizujeme vizualizaci
+        # Vizualizaci obnovíme jednou za průchod event loopu, i když se změní víc checkboxů
+        if self._token_refresh_pending:
+            return
+        self._token_refresh_pending = True
+        QTimer.singleShot(0, self._flush_token_changes)
+    
+    def _flush_token_changes(self):
+        """Promítne ručně nastavené tokeny do vizualizace, seznamů přechodů a statusu."""
+        self._token_refresh_pending = False
+        if not self.simulator or not self.simulator.net:
+            return
+        
+        # Aktualizujeme vizualizaci (_on_marking_changed obnoví i seznamy přechodů)
         if hasattr(self, 'marking_changed'):
             self.marking_changed()
+        else:
+            self._update_lists()
         
         # Aktualizujeme status
-        marking = self.simulator.get_marking()
-        token_count = sum(1 for has_token in marking.values() if has_token)
+        token_count = sum(self.simulator.get_marking().values())
         self.lbl_status.setText(f"Status: {token_count} token(s) set")
-        
-        # Aktualizujeme seznamy přechodů (aby se zobrazily blokované přechody)
-        self._update_lists()
     
     def _update_token_checkboxes(self):
         """Aktualizuje checkboxy podle aktuálního označení sítě."""
         self._update_token_checkboxes_silent()
     
-    def _update_token_checkboxes_silent(self):
-        """Aktualizuje checkboxy bez emitování signálů (aby se nezacyklil)."""
+    def _update_token_checkboxes_silent(self, place_ids: Optional[List[str]] = None,
+                                        marking: Optional[Dict[str, bool]] = None):
+        """Aktualizuje checkboxy bez emitování signálů (aby se nezacyklil).
+        
+        Pokud je zadáno place_ids, aktualizují se jen checkboxy těchto míst;
+        již získané označení lze předat v marking.
+        """
         if not self.simulator or not self.simulator.net:
             return
             
-        marking = self.simulator.get_marking()
-        for place_id, checkbox in self.token_checkboxes.items():
-            has_token = marking.get(place_id, False)
-            # Dočasně odpojíme signál, aby se nezacyklil
-            checkbox.blockSignals(True)
-            checkbox.setChecked(has_token)
-            checkbox.blockSignals(False)
+        if marking is None:
+            marking = self.simulator.get_marking()
+        if place_ids is None:
+            place_ids = self.token_checkboxes.keys()
+        # Jeden příznak pro celou dávku místo blockSignals u každého checkboxu;
+        # _on_token_checkbox_changed změny během synchronizace ignoruje
+        self._syncing_checkboxes = True
+        try:
+            for place_id in place_ids:
+                checkbox = self.token_checkboxes.get(place_id)
+                if checkbox is None:
+                    continue
+                has_token = marking.get(place_id, False)
+                if checkbox.isChecked() != has_token:
+                    checkbox.setChecked(has_token)
+        finally:
+            self._syncing_checkboxes = False
     
     def _on_export_gif(self):
         """Exportuje simulaci jako GIF animaci."""
         if not self.simulator or not self.simulator.net:
             QMessageBox.warning(self, "Export Error", "Simulation not built. Please press Reset first.")
             return
+        if self._gif_saving:
+            QMessageBox.warning(self, "Export Error", "Previous GIF export is still being saved.")
+            return
         
         # Vybereme soubor pro uložení
-        from persistence.json_io import safe_base_filename
         base = safe_base_filename(self.main_window._current_tab_title() if hasattr(self.main_window, '_current_tab_title') else None)
         path, _ = QFileDialog.getSaveFileName(
             self, "Export Simulation GIF", f"{base}_simulation.gif", "GIF (*.gif)"
@@ -511,31 +630,26 @@ class SimulationPanel(QDockWidget):
             return
         
         # Uložíme počáteční stav
-        initial_marking = self.simulator.get_marking().copy()
+        initial_marking = self.simulator.get_marking()
         
         # Získáme delay mezi kroky
         delay_ms = self.spin_delay.value()
         delay_seconds = delay_ms / 1000.0
+        view = None  # Hlavní pohled, jehož překreslování se během nahrávání vypne
+        encoding = False  # Po předání snímků úloze se export dokončí v _on_gif_saved
+        uncached = ExitStack()  # Vypnutá cache prvků po dobu nahrávání (viz níže)
+        scene = None  # Scéna a stav její mřížky pro obnovu i při chybě
+        original_grid_state = None
         
         try:
-            # Zkusíme použít imageio pro vytvoření GIF
-            try:
-                import imageio
-                use_imageio = True
-            except ImportError:
-                # Zkusíme pillow
-                try:
-                    from PIL import Image
-                    use_imageio = False
-                except ImportError:
-                    QMessageBox.warning(
-                        self, "Export Error",
-                        "Please install imageio or pillow:\n"
-                        "pip install imageio\n"
-                        "or\n"
-                        "pip install pillow"
-                    )
-                    return
+            # GIF skládáme přes Pillow
+            if _get_pil_image() is None:
+                QMessageBox.warning(
+                    self, "Export Error",
+                    "Please install pillow:\n"
+                    "pip install pillow"
+                )
+                return
             
             # Získáme scénu pro export
             if not self.main_window or not hasattr(self.main_window, 'scene'):
@@ -543,94 +657,100 @@ class SimulationPanel(QDockWidget):
                 return
             
             scene = self.main_window.scene
-            rb = scene.itemsBoundingRect().adjusted(-20, -20, 20, 20)
+            rb = scene.cached_items_bounding_rect().adjusted(-20, -20, 20, 20)
             
             # Vypneme mřížku pro export
             original_grid_state = scene._draw_grid
             scene.set_draw_grid(False)
             
             frames = []
+            buf = self._frame_buffer(rb)
+            
+            def capture():
+                # Scéna, výřez i buffer jsou po celý export stejné
+                return self._to_gif_frame(self._capture_frame(scene, rb, buf))
+            
+            # Hlavní pohled během nahrávání nepřekreslujeme - snímky se renderují
+            # přímo ze scény a view by jinak hromadil oblasti k překreslení z každého kroku
+            view = getattr(self.main_window, 'view', None)
+            if view is not None:
+                original_update_mode = view.viewportUpdateMode()
+                view.setViewportUpdateMode(QGraphicsView.NoViewportUpdate)
+            
             max_steps = 100  # Maximální počet kroků pro zabránění zacyklení
             
             self.lbl_status.setText("Status: Recording...")
+            self._exporting = True
             self.btn_export_gif.setEnabled(False)
             
+            # Snímky se renderují přímo z prvků, ne z jejich cache pixmap
+            uncached.enter_context(scene.uncached_rendering())
+            
             # Uložíme první snímek (počáteční stav)
-            img = self._capture_frame(scene, rb)
-            frames.append(img)
+            frames.append(capture())
             
             # Provedeme simulaci krok za krokem až do zastavení
             # (když se marking již nemění nebo není žádný další krok)
             step_count = 0
-            previous_marking = initial_marking.copy()
+            previous_marking = self.simulator.get_marked_places()
+            new_marking = previous_marking
             stable_count = 0  # Počet po sobě jdoucích kroků se stejným markingem
             max_stable = 2  # Po kolika stejných krocích zastavíme (zabrání zacyklení)
             
-            from PySide6.QtWidgets import QApplication
-            from PySide6.QtCore import QEventLoop, QTimer as QtTimer
-            
             while step_count < max_steps:
-                # Získáme aktuální marking před krokem
-                current_marking = self.simulator.get_marking().copy()
+                # Marking před krokem je marking po předchozím kroku
+                current_marking = new_marking
                 
-                # Provedeme jeden krok
+                # Provedeme jeden krok - signály simulátoru jsou přímé, takže tokeny
+                # prvků jsou po návratu už nastavené a snímek lze hned zachytit.
+                # Na delay se nečeká - rychlost přehrávání určuje jen duration snímků GIFu.
                 result = self.simulator.step()
                 
-                # Aktualizujeme UI (aby se vizualizace tokenů aktualizovala)
-                QApplication.processEvents()
-                
-                # Počkáme na delay (pro vizualizaci)
-                loop = QEventLoop()
-                QtTimer.singleShot(delay_ms, loop.quit)
-                loop.exec()
-                
                 # Získáme nový marking po kroku
-                new_marking = self.simulator.get_marking().copy()
+                new_marking = self.simulator.get_marked_places()
                 
                 # Uložíme snímek po každém kroku (pokud došlo ke změně markingu)
                 if new_marking != current_marking:
-                    img = self._capture_frame(scene, rb)
-                    frames.append(img)
-                    print(f"[Export] Step {step_count + 1}: Marking changed, captured frame")
+                    frames.append(capture())
+                    log.debug("Export step %d: marking changed, captured frame", step_count + 1)
                 else:
-                    print(f"[Export] Step {step_count + 1}: No marking change after step")
+                    log.debug("Export step %d: no marking change after step", step_count + 1)
                 
                 step_count += 1
                 
-                # Aktualizujeme UI znovu
-                QApplication.processEvents()
+                # Event loop se během nahrávání záměrně nespouští - ovládání simulace
+                # (Step/Play/Reset, přepnutí tabu) by jinak mohlo změnit síť pod smyčkou
                 
                 # Zkontrolujeme, zda se marking stabilizoval (zůstal stejný jako předchozí)
                 if new_marking == previous_marking:
                     stable_count += 1
                     if stable_count >= max_stable:
-                        print(f"[Export] Marking stabilized after {step_count} steps, stopping")
+                        log.debug("Export: marking stabilized after %d steps, stopping", step_count)
                         # Zaznamenáme ještě finální stav (pokud jsme ho ještě nezaznamenali)
                         if new_marking != current_marking:
-                            img = self._capture_frame(scene, rb)
-                            frames.append(img)
+                            frames.append(capture())
                         break
                 else:
                     stable_count = 0
                 
-                previous_marking = new_marking.copy()
+                previous_marking = new_marking
                 
                 # Pokud není žádný další krok možný, zastavíme
                 if not result:
-                    print(f"[Export] No more fireable transitions after {step_count} steps")
+                    log.debug("Export: no more fireable transitions after %d steps", step_count)
                     # Zaznamenáme finální stav (pokud jsme ho ještě nezaznamenali)
                     if new_marking != current_marking:
-                        img = self._capture_frame(scene, rb)
-                        frames.append(img)
+                        frames.append(capture())
                     break
             
             # Pokud jsme ještě nezaznamenali finální stav, zaznamenáme ho teď
             if len(frames) == 1:  # Pokud máme jen počáteční stav
-                print("[Export] No changes occurred, capturing final state anyway")
-                img = self._capture_frame(scene, rb)
-                frames.append(img)
+                log.debug("Export: no changes occurred, capturing final state anyway")
+                frames.append(capture())
             
-            # Vrátíme počáteční stav
+            # Vrátíme počáteční stav (už s obnovou panelu)
+            uncached.close()
+            self._exporting = False
             for place_id, has_token in initial_marking.items():
                 self.simulator.net.set_token(place_id, has_token)
             self.simulator.marking_changed.emit()
@@ -640,116 +760,86 @@ class SimulationPanel(QDockWidget):
             
             # Vytvoříme GIF
             # POZNÁMKA: Pillow má lepší kontrolu nad duration pro GIF než imageio
-            # Použijeme pillow přímo, i když máme imageio
-            import numpy as np
-            from PIL import Image
-            
-            # Převod numpy arrays na PIL Images
-            pil_frames = [Image.fromarray(frame) for frame in frames]
-            
-            if pil_frames:
-                # Pillow používá duration v milisekundách a má lepší kontrolu
-                # Pro GIF musíme použít duration jako int v milisekundách
-                # POZNÁMKA: Některé prohlížeče mají minimální duration (např. 20ms)
-                # Zajistíme minimálně 20ms, ale použijeme hodnotu z UI
-                gif_duration = max(int(delay_ms), 20)  # Minimálně 20ms pro GIF standard
-                
-                pil_frames[0].save(
-                    path,
-                    save_all=True,
-                    append_images=pil_frames[1:] if len(pil_frames) > 1 else [],
-                    duration=gif_duration,  # V milisekundách
-                    loop=0
-                )
-                print(f"[Export] Saved GIF with {len(frames)} frames using pillow, duration={gif_duration}ms ({gif_duration/1000.0}s) per frame")
-            
-            QMessageBox.information(
-                self, "Export Complete",
-                f"Simulation exported as GIF:\n{path}\n\n{len(frames)} frames recorded."
-            )
+            # Snímky jsou už při nahrávání převedené na paletové obrázky
+            # POZNÁMKA: Některé prohlížeče mají minimální duration (např. 20ms)
+            # Zajistíme minimálně 20ms, ale použijeme hodnotu z UI
+            gif_duration = max(int(delay_ms), 20)  # Minimálně 20ms pro GIF standard
+            
+            # Kódování GIFu (LZW všech snímků) běží v thread poolu, UI mezitím nezamrzne
+            task = _GifSaveTask(path, frames, gif_duration, self._gif_save_signals)
+            self._gif_saving = True
+            encoding = True
+            self.lbl_status.setText("Status: Encoding GIF...")
+            QThreadPool.globalInstance().start(task)
+            log.debug("Encoding GIF with %d frames in background, duration=%dms per frame",
+                      len(frames), gif_duration)
             
         except Exception as e:
             QMessageBox.critical(self, "Export Error", f"Failed to export GIF:\n{str(e)}")
             # Vrátíme počáteční stav i při chybě
+            self._exporting = False
             if self.simulator and self.simulator.net:
                 for place_id, has_token in initial_marking.items():
                     self.simulator.net.set_token(place_id, has_token)
                 self.simulator.marking_changed.emit()
-            if hasattr(scene, 'set_draw_grid'):
+            if scene is not None and original_grid_state is not None:
                 scene.set_draw_grid(original_grid_state)
         finally:
-            self.lbl_status.setText("Status: Export complete")
-            self.btn_export_gif.setEnabled(True)
+            uncached.close()
+            self._exporting = False
+            if view is not None:
+                view.setViewportUpdateMode(original_update_mode)
+                view.viewport().update()
+            if not encoding:
+                self.lbl_status.setText("Status: Export complete")
+                self.btn_export_gif.setEnabled(True)
+    
+    def _on_gif_saved(self, path: str, frame_count: int, error: str):
+        """Dokončí export GIFu po uložení souboru v pracovním vlákně."""
+        self._gif_saving = False
+        self.btn_export_gif.setEnabled(True)
+        if error:
+            self.lbl_status.setText("Status: Export failed")
+            QMessageBox.critical(self, "Export Error", f"Failed to export GIF:\n{error}")
+            return
+        self.lbl_status.setText("Status: Export complete")
+        QMessageBox.information(
+            self, "Export Complete",
+            f"Simulation exported as GIF:\n{path}\n\n{frame_count} frames recorded."
+        )
+    
+    def is_saving_gif(self) -> bool:
+        """Vrátí True, pokud se na pozadí ještě ukládá GIF."""
+        return self._gif_saving
     
-    def _capture_frame(self, scene, bounding_rect):
-        """Zachytí jeden snímek scény jako QImage a převede na formát pro GIF."""
-        # Vytvoříme obrázek s bílým pozadím
-        img = QImage(int(bounding_rect.width()), int(bounding_rect.height()), QImage.Format_ARGB32_Premultiplied)
-        # Vyplníme bílou barvou (0xFFFFFFFF = bílá, ne průhledná)
-        img.fill(0xFFFFFFFF)
-        painter = QPainter(img)
-        # Nastavíme bílé pozadí pro renderování
-        painter.setBackground(Qt.white)
-        scene.render(painter, target=QRectF(0, 0, bounding_rect.width(), bounding_rect.height()), source=bounding_rect)
+    @staticmethod
+    def _to_gif_frame(img):
+        """Převede RGB snímek na paletový obrázek (1 B/px), jak ho GIF stejně uloží."""
+        return img.convert("P", palette=_get_pil_image().Palette.ADAPTIVE)
+    
+    @staticmethod
+    def _frame_buffer(bounding_rect) -> QImage:
+        """Alokuje jeden obrázek pro všechny snímky exportu (rozměr je po celý export stejný)."""
+        # Neprůhledný formát - scéna se kreslí na bílé pozadí, alfa kanál není potřeba
+        return QImage(int(bounding_rect.width()), int(bounding_rect.height()),
+                      QImage.Format_RGBX8888)
+    
+    def _capture_frame(self, scene, bounding_rect, buf: QImage = None):
+        """Zachytí jeden snímek scény do bufferu a vrátí ho jako RGB obrázek Pillow."""
+        if buf is None:
+            buf = self._frame_buffer(bounding_rect)
+        # Vyplníme bílou barvou (neprůhlednou) - pozadí GIFu
+        buf.fill(Qt.white)
+        painter = QPainter(buf)
+        # GIF má paletu 256 barev - vyhlazené okraje by ji jen zaplnily mezitóny
+        painter.setRenderHint(QPainter.Antialiasing, False)
+        painter.setRenderHint(QPainter.TextAntialiasing, False)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform, False)
+        scene.render(painter, target=QRectF(0, 0, buf.width(), buf.height()), source=bounding_rect)
         painter.end()
         
-        # Převedeme QImage na formát použitelný pro GIF
-        # QImage -> RGB format
-        img_rgb = img.convertToFormat(QImage.Format_RGB888)
-        width = img_rgb.width()
-        height = img_rgb.height()
-        
-        # Převedeme na numpy array pomocí bytes
-        import numpy as np
-        
-        # Převedeme QImage na numpy array pomocí buffer metody
-        # (nejspolehlivější způsob)
-        buffer = QBuffer()
-        buffer.open(QIODevice.WriteOnly)
-        img_rgb.save(buffer, "PNG")
-        buffer.close()
-        
-        # Načteme data pomocí Pillow nebo imageio
-        try:
-            from PIL import Image
-            pil_img = Image.open(io.BytesIO(buffer.data()))
-            arr = np.array(pil_img)
-            
-            # Zajistíme bílé pozadí - pokud je obrázek RGBA, sloučíme s bílým pozadím
-            if arr.shape[2] == 4:
-                # RGBA - sloučíme s bílým pozadím
-                alpha = arr[:, :, 3:4] / 255.0
-                rgb = arr[:, :, :3]
-                # Kompozice přes bílé pozadí
-                arr = (rgb * alpha + 255 * (1 - alpha)).astype(np.uint8)
-            else:
-                # Už je RGB, použijeme přímo
-                arr = arr[:, :, :3]
-            
-            # Zajistíme, že pozadí je skutečně bílé (pokud je pixel velmi tmavý, může být to pozadí)
-            # Pro jistotu: pokud je pixel téměř černý (0,0,0), nahradíme ho bílou
-            # (ale to může být problematické, takže to necháme být)
-            
-        except ImportError:
-            # Pokud není PIL, použijeme imageio
-            try:
-                import imageio
-                arr = imageio.imread(io.BytesIO(buffer.data()))
-                # Pokud je to RGBA, převedeme na RGB s bílým pozadím
-                if len(arr.shape) == 3 and arr.shape[2] == 4:
-                    alpha = arr[:, :, 3:4] / 255.0
-                    rgb = arr[:, :, :3]
-                    arr = (rgb * alpha + 255 * (1 - alpha)).astype(np.uint8)
-            except ImportError:
-                # Fallback: přímá konverze z QImage (méně spolehlivá)
-                byte_data = img_rgb.bits()
-                if byte_data:
-                    byte_data.setsize(img_rgb.byteCount())
-                    arr = np.frombuffer(byte_data, dtype=np.uint8, count=width * height * 3)
-                    arr = arr.reshape((height, width, 3))
-                else:
-                    raise RuntimeError("Cannot convert QImage to numpy array")
-        
-        # Vracíme numpy array (použijeme ho pro imageio i pillow)
-        return arr
+        # Pillow čte bity bufferu přímo a při dekódování (RGBX -> RGB) zahodí výplňový bajt.
+        # Výsledek je kopie, buffer se přepíše dalším snímkem.
+        return _get_pil_image().frombuffer("RGB", (buf.width(), buf.height()), buf.constBits(),
+                                           "raw", "RGBX", buf.bytesPerLine(), 1)
 
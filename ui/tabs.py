@@ -10,9 +10,23 @@ class RenameableTabBar(QTabBar):
     """
     TabBar s podporou přejmenování tabů.
     
-    Emituje signál renameRequested(int) při dvojkliku nebo výběru z kontextového menu.
+    Emituje signál renameRequested(int) při dvojkliku nebo výběru z kontextového menu
+    a tabsChanged() při každém přidání, odebrání nebo přesunu tabu.
     """
     renameRequested = Signal(int)  # Index tabu k přejmenování
+    tabsChanged = Signal()  # Změnilo se pořadí nebo počet tabů
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.tabMoved.connect(lambda _from, _to: self.tabsChanged.emit())
+
+    def tabInserted(self, index):
+        super().tabInserted(index)
+        self.tabsChanged.emit()
+
+    def tabRemoved(self, index):
+        super().tabRemoved(index)
+        self.tabsChanged.emit()
 
     def mouseDoubleClickEvent(self, event):
         idx = self.tabAt(event.pos())
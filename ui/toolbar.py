@@ -324,6 +324,11 @@ class ToolbarManager:
             "aggregation", "exhibition", "generalization", "instantiation"
         ])
         
+        # Index položky podle typu linku (pro rychlé přepnutí klávesovou zkratkou)
+        self.main_window._link_type_to_index = {
+            self.main_window.cmb_default_link_type.itemText(i): i
+            for i in range(self.main_window.cmb_default_link_type.count())
+        }
         self.main_window.cmb_default_link_type.setCurrentText(self.main_window.default_link_type)
         self.main_window.cmb_default_link_type.currentTextChanged.connect(
             lambda text: setattr(self.main_window, "default_link_type", text) if "───" not in text else None
@@ -28,6 +28,8 @@ class EditorView(QGraphicsView):
         self.setRenderHints(self.renderHints() | self.renderHints().Antialiasing)
         self.setDragMode(QGraphicsView.RubberBandDrag)
         self.setViewportUpdateMode(QGraphicsView.BoundingRectViewportUpdate)
+        # Mřížka v pozadí se rasterizuje jednou a při posunu se jen posouvá
+        self.setCacheMode(QGraphicsView.CacheBackground)
         self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
         self.setRubberBandSelectionMode(Qt.IntersectsItemBoundingRect)
         self.setMouseTracking(True)